@@ -0,0 +1,16 @@
+import argparse
+from ngram_classifier import NGramClassifier
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--input", help="input (pickled) ngram model file")
+    parser.add_argument("-o", "--output", help="output binary model file")
+    args = parser.parse_args()
+
+    if not args.input:
+        raise Exception("missing input file")
+    if not args.output:
+        raise Exception("missing output file")
+
+    classifier = NGramClassifier(model_path=args.input)
+    classifier.serialize_compiled(args.output)
@@ -1 +1,9 @@
 from .discovertext_api import DiscoverTextApi
+
+
+def __getattr__(name):
+    # imported on first use, so aiohttp is only needed by the asyncio client
+    if name == "AsyncDiscoverTextApi":
+        from .async_discovertext_api import AsyncDiscoverTextApi
+        return AsyncDiscoverTextApi
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -0,0 +1,297 @@
+import asyncio
+import json
+import time
+from collections import deque
+from itertools import count, islice
+import aiohttp
+from .discovertext_api import DiscoverTextApi
+
+
+class AsyncDiscoverTextApi(DiscoverTextApi):
+    '''
+    asyncio version of DiscoverTextApi: the same methods, as coroutines, sharing one
+    aiohttp session. Up to concurrency requests are in flight at once, and the JWT is
+    renewed by a single request even when many are waiting on it.
+
+    use as an async context manager (or call close) to release the session:
+
+        async with AsyncDiscoverTextApi(credential_file=...) as dt_api:
+            await dt_api.login()
+            units = await dt_api.get_archive_units(archive_id)
+    '''
+
+    def __init__(self, *args, concurrency=100, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._concurrency = concurrency
+        self._aio_session = None
+        self._semaphore = None
+        self._async_renew_lock = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def close(self):
+        if self._aio_session is not None:
+            await self._aio_session.close()
+            self._aio_session = None
+
+    def _get_aio_session(self):
+        # created lazily so it belongs to the running event loop
+        if self._aio_session is None:
+            self._aio_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self._concurrency),
+                timeout=aiohttp.ClientTimeout(total=self._timeout))
+            self._semaphore = asyncio.Semaphore(self._concurrency)
+            self._async_renew_lock = asyncio.Lock()
+        return self._aio_session
+
+    def _get_retry_wait(self, response, retry_count):
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return int(retry_after)
+        return self._backoff_factor * (2 ** retry_count)
+
+    async def _request(self, method, request_url, **kwargs):
+        '''
+        sends a request, retrying with backoff on 429/5xx responses, dropped connections
+        and timeouts. As with the sync client, only idempotent requests are retried
+        '''
+        session = self._get_aio_session()
+        max_retries = self._max_retries if method in DiscoverTextApi.RETRY_METHODS else 0
+        retry_count = 0
+        while True:
+            try:
+                async with self._semaphore:
+                    async with session.request(method, request_url, **kwargs) as response:
+                        if (response.status in DiscoverTextApi.RETRY_STATUS_CODES and
+                                retry_count < max_retries):
+                            retry_wait = self._get_retry_wait(
+                                response, retry_count)
+                        else:
+                            response.raise_for_status()
+                            return await response.text()
+            except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError):
+                if retry_count >= max_retries:
+                    raise
+                retry_wait = self._get_retry_wait(None, retry_count)
+            retry_count += 1
+            await asyncio.sleep(retry_wait)
+
+    async def _check_renew(self):
+        self._check_jwt()
+        if self._jwt_token_renewal < int(time.time()):
+            self._get_aio_session()
+            # only the first waiting request renews, the rest see the new token
+            async with self._async_renew_lock:
+                if self._jwt_token_renewal < int(time.time()):
+                    await self.renew_token()
+
+    async def _send_get(self, request_url, query_params=None, check_credentials=True):
+        if check_credentials:
+            await self._check_renew()
+        return await self._request("GET", request_url,
+                                   params=query_params,
+                                   headers=self._get_request_headers())
+
+    async def _send_post(self, request_url, post_data=None, query_params=None, check_credentials=True):
+        if check_credentials:
+            await self._check_renew()
+        return await self._request("POST", request_url,
+                                   json=json.dumps(post_data),
+                                   params=query_params,
+                                   headers=self._get_request_headers())
+
+    async def login(self, username=None, password=None):
+        '''
+        login the user and get the initial JWT
+
+        https://api.discovertext.com/Docs/GettingStarted/Authentication
+        '''
+        request_url = f'{self._api_base_url}/login'
+        request_data = self._get_login_request_data(username, password)
+        self._set_token_and_renewal(await self._request("POST", request_url, json=request_data))
+
+    async def get_oauth_access_token_url(self, auth_code, redirect_url):
+        request_url = f'{self._api_base_url}/login/token'
+        response_text = await self._request("GET", request_url, params={
+            "client_id": self._api_key,
+            "client_secret": self._api_secret,
+            "grant_type": "authorization_code",
+            "code": auth_code,
+            "redirect_uri": redirect_url
+        })
+        self._set_token_and_renewal(json.loads(response_text)["token"])
+
+    async def renew_token(self):
+        request_url = f'{self._api_base_url}/login/renew'
+        self._set_token_and_renewal(await self._request("GET", request_url,
+                                                        headers=self._get_request_headers()))
+
+    async def get_unit_types(self):
+        request_url = f'{self._api_base_url}/system/unitTypes'
+        return json.loads(await self._send_get(request_url))
+
+    async def get_projects(self, offset=0, limit=20):
+        request_url = f'{self._api_base_url}/projects'
+        return json.loads(await self._send_get(request_url, {
+            "offset": offset,
+            "limit": limit
+        }))
+
+    async def get_project_archives(self, project_id, offset=0, limit=20):
+        request_url = f'{self._api_base_url}/projects/{project_id}/archives'
+        return json.loads(await self._send_get(request_url, {
+            "offset": offset,
+            "limit": limit
+        }))
+
+    async def get_archive(self, archive_id):
+        request_url = f'{self._api_base_url}/archives/{archive_id}'
+        return json.loads(await self._send_get(request_url, {}))
+
+    async def get_archive_units(self, archive_id, offset=0, limit=20, include_metadata=True):
+        request_url = f'{self._api_base_url}/archives/{archive_id}/units'
+        params = {
+            "offset": offset,
+            "limit": limit,
+            "includeMetadata": "true" if include_metadata else "false"
+        }
+        return json.loads(await self._send_get(request_url, params))
+
+    async def get_project_buckets(self, project_id, offset=0, limit=20):
+        request_url = f'{self._api_base_url}/projects/{project_id}/buckets'
+        return json.loads(await self._send_get(request_url, {
+            "offset": offset,
+            "limit": limit
+        }))
+
+    async def get_bucket(self, bucket_id):
+        request_url = f'{self._api_base_url}/buckets/{bucket_id}'
+        return json.loads(await self._send_get(request_url, {}))
+
+    async def get_bucket_units(self, bucket_id, offset=0, limit=20, include_metadata=True):
+        request_url = f'{self._api_base_url}/buckets/{bucket_id}/units'
+        params = {
+            "offset": offset,
+            "limit": limit,
+            "includeMetadata": "true" if include_metadata else "false"
+        }
+        return json.loads(await self._send_get(request_url, params))
+
+    async def get_codeset_listing(self, offset=0, limit=20):
+        request_url = f'{self._api_base_url}/codesets'
+        params = {
+            "offset": offset,
+            "limit": limit
+        }
+        return json.loads(await self._send_get(request_url, params))
+
+    async def get_codeset_item(self, codeset_id):
+        request_url = f'{self._api_base_url}/codesets/{codeset_id}'
+        return json.loads(await self._send_get(request_url, {}))
+
+    async def get_codeset_data(self, codeset_id, offset=0, limit=20):
+        request_url = f'{self._api_base_url}/codesets/{codeset_id}/data'
+        params = {
+            "offset": offset,
+            "limit": limit
+        }
+        return json.loads(await self._send_get(request_url, params))
+
+    async def _iter_pages(self, fetch_page, page_size, concurrency, offset):
+        '''
+        async generator of (offset, page) for a paginated listing, see DiscoverTextApi._iter_pages
+        '''
+        first_page = await fetch_page(offset, page_size)
+        if not first_page:
+            return
+        yield offset, first_page
+
+        remaining_offsets = iter(
+            range(offset + page_size, first_page["meta"]["count"], page_size))
+        in_flight = {}
+        for this_offset in remaining_offsets:
+            in_flight[asyncio.ensure_future(
+                fetch_page(this_offset, page_size))] = this_offset
+            if len(in_flight) >= concurrency:
+                break
+        try:
+            while in_flight:
+                done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    this_offset = in_flight.pop(future)
+                    next_offset = next(remaining_offsets, None)
+                    if next_offset is not None:
+                        in_flight[asyncio.ensure_future(
+                            fetch_page(next_offset, page_size))] = next_offset
+                    yield this_offset, future.result()
+        finally:
+            for future in in_flight:
+                future.cancel()
+
+    def iter_archive_unit_pages(self, archive_id, page_size=100, concurrency=4,
+                                include_metadata=True, offset=0):
+        return self._iter_pages(lambda this_offset, limit: self.get_archive_units(
+            archive_id, offset=this_offset, limit=limit, include_metadata=include_metadata),
+            page_size, concurrency, offset)
+
+    def iter_bucket_unit_pages(self, bucket_id, page_size=100, concurrency=4,
+                               include_metadata=True, offset=0):
+        return self._iter_pages(lambda this_offset, limit: self.get_bucket_units(
+            bucket_id, offset=this_offset, limit=limit, include_metadata=include_metadata),
+            page_size, concurrency, offset)
+
+    async def _iter_items(self, fetch_page, page_size, prefetch, offset):
+        '''
+        async generator of the items of a paginated listing, in order, see DiscoverTextApi._iter_items
+        '''
+        first_page = await fetch_page(offset, page_size)
+        if not first_page:
+            return
+        total_count = first_page.get("meta", {}).get("count")
+        if total_count is None:
+            next_offsets = count(offset + page_size, page_size)
+        else:
+            next_offsets = iter(
+                range(offset + page_size, total_count, page_size))
+
+        pending = deque(asyncio.ensure_future(fetch_page(this_offset, page_size))
+                        for this_offset in islice(next_offsets, prefetch))
+        try:
+            page = first_page
+            while True:
+                items = page.get("items") or []
+                for item in items:
+                    yield item
+                if not pending or (total_count is None and len(items) < page_size):
+                    return
+                page = await pending.popleft()
+                if not page:
+                    return
+                next_offset = next(next_offsets, None)
+                if next_offset is not None:
+                    pending.append(asyncio.ensure_future(
+                        fetch_page(next_offset, page_size)))
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def iter_archive_units(self, archive_id, page_size=100, prefetch=2,
+                           include_metadata=True, offset=0):
+        return self._iter_items(lambda this_offset, limit: self.get_archive_units(
+            archive_id, offset=this_offset, limit=limit, include_metadata=include_metadata),
+            page_size, prefetch, offset)
+
+    def iter_bucket_units(self, bucket_id, page_size=100, prefetch=2,
+                          include_metadata=True, offset=0):
+        return self._iter_items(lambda this_offset, limit: self.get_bucket_units(
+            bucket_id, offset=this_offset, limit=limit, include_metadata=include_metadata),
+            page_size, prefetch, offset)
+
+    def iter_codeset_data(self, codeset_id, page_size=100, prefetch=2, offset=0):
+        return self._iter_items(lambda this_offset, limit: self.get_codeset_data(
+            codeset_id, offset=this_offset, limit=limit),
+            page_size, prefetch, offset)
@@ -3,17 +3,27 @@ import hashlib
 import hmac
 import json
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import threading
 import time
 import urllib.parse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from itertools import count, islice
 
 
 class DiscoverTextApi():
     API_VERSION = "v1"
     BASE_URL = "https://api.discovertext.com"
+    RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+    # the methods urllib3 retries by default: idempotent ones, never POST
+    RETRY_METHODS = Retry.DEFAULT_ALLOWED_METHODS
 
     def __init__(self, credential_file=None,
                  api_key=None, api_secret=None, hostname=None,
-                 username=None, password=None, api_base_url=None):
+                 username=None, password=None, api_base_url=None,
+                 pool_size=10, max_retries=3, backoff_factor=0.5, timeout=60):
 
         if (credential_file):
             with open(credential_file) as credential_file_handle:
@@ -35,6 +45,14 @@ class DiscoverTextApi():
         self._jwt_token = None
         self._jwt_token_renewal = 0
         self._jwt_token_exp = 0
+        self._renew_lock = threading.Lock()
+
+        self._pool_size = pool_size
+        self._max_retries = max_retries
+        self._backoff_factor = backoff_factor
+        self._timeout = timeout
+        self._session = None
+        self._session_lock = threading.Lock()
 
         if not self._api_key:
             raise "missing api key"
@@ -46,6 +64,35 @@ class DiscoverTextApi():
         base_url = DiscoverTextApi.BASE_URL if not api_base_url else api_base_url
         self._api_base_url = f'{base_url}/api/{DiscoverTextApi.API_VERSION}'
 
+    @property
+    def session(self):
+        '''
+        the pooled, keep-alive HTTP session used for every request. Safe to share
+        between threads; the pool holds up to pool_size connections and idempotent
+        requests are retried with backoff on 429/5xx responses
+        '''
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    retries = Retry(total=self._max_retries,
+                                    backoff_factor=self._backoff_factor,
+                                    status_forcelist=DiscoverTextApi.RETRY_STATUS_CODES,
+                                    allowed_methods=DiscoverTextApi.RETRY_METHODS,
+                                    raise_on_status=False)
+                    adapter = HTTPAdapter(pool_connections=self._pool_size,
+                                          pool_maxsize=self._pool_size,
+                                          max_retries=retries)
+                    session = requests.Session()
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    self._session = session
+        return self._session
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
     def _check_jwt(self):
         if not self._jwt_token or self._jwt_token_renewal == 0:
             raise "no token issued"
@@ -55,7 +102,10 @@ class DiscoverTextApi():
     def _check_renew(self):
         self._check_jwt()
         if self._jwt_token_renewal < int(time.time()):
-            self.renew_token()
+            # only one of several concurrent requests should renew the token
+            with self._renew_lock:
+                if self._jwt_token_renewal < int(time.time()):
+                    self.renew_token()
 
     def _get_request_response(self, response):
         if not response:
@@ -63,31 +113,33 @@ class DiscoverTextApi():
         response.raise_for_status()
         return response.text
 
-    def _send_get(self, request_url, query_params=None, check_credentials=True):
-        if check_credentials:
-            self._check_renew()
-        request_headers = {
+    def _get_request_headers(self):
+        return {
             "Content-Type": "application/json",
             "Authorization": f'Bearer {self._jwt_token}'
         }
-        response = requests.get(url=request_url,
-                                params=query_params,
-                                headers=request_headers
-                                )
+
+    def _send_get(self, request_url, query_params=None, check_credentials=True):
+        if check_credentials:
+            self._check_renew()
+        request_headers = self._get_request_headers()
+        response = self.session.get(url=request_url,
+                                    params=query_params,
+                                    headers=request_headers,
+                                    timeout=self._timeout
+                                    )
         return self._get_request_response(response)
 
     def _send_post(self, request_url, post_data=None, query_params=None, check_credentials=True):
         if check_credentials:
             self._check_renew()
-        request_headers = {
-            "Content-Type": "application/json",
-            "Authorization": f'Bearer {self._jwt_token}'
-        }
-        response = requests.post(url=request_url,
-                                 json=json.dumps(post_data),
-                                 params=query_params,
-                                 headers=request_headers
-                                 )
+        request_headers = self._get_request_headers()
+        response = self.session.post(url=request_url,
+                                     json=json.dumps(post_data),
+                                     params=query_params,
+                                     headers=request_headers,
+                                     timeout=self._timeout
+                                     )
         return self._get_request_response(response)
 
     def _set_token_and_renewal(self, token):
@@ -96,12 +148,7 @@ class DiscoverTextApi():
         self._jwt_token_exp = int(time.time()) + 600
         self._jwt_token_renewal = int(time.time()) + 360
 
-    def login(self, username=None, password=None):
-        '''
-        login the user and get the initial JWT
-
-        https://api.discovertext.com/Docs/GettingStarted/Authentication
-        '''
+    def _get_login_request_data(self, username=None, password=None):
         login_username = self._username if username is None else username
         login_password = self._password if password is None else password
         if not login_username:
@@ -115,8 +162,7 @@ class DiscoverTextApi():
         signature = base64.b64encode(
             hmac.new(secret, message, digestmod=hashlib.sha256).digest()).decode('utf-8')
 
-        request_url = f'{self._api_base_url}/login'
-        request_data = {
+        return {
             "apiKey": self._api_key,
             "hostname": self._hostname,
             "username": login_username,
@@ -125,7 +171,17 @@ class DiscoverTextApi():
             "signature": signature
         }
 
-        response = requests.post(url=request_url, json=request_data)
+    def login(self, username=None, password=None):
+        '''
+        login the user and get the initial JWT
+
+        https://api.discovertext.com/Docs/GettingStarted/Authentication
+        '''
+        request_url = f'{self._api_base_url}/login'
+        request_data = self._get_login_request_data(username, password)
+
+        response = self.session.post(
+            url=request_url, json=request_data, timeout=self._timeout)
         response.raise_for_status()
         self._set_token_and_renewal(response.text)
 
@@ -136,27 +192,26 @@ class DiscoverTextApi():
 
     def get_oauth_access_token_url(self, auth_code, redirect_url):
         request_url = f'{self._api_base_url}/login/token'
-        response = requests.get(url=request_url,
-                                params={
-                                    "client_id": self._api_key,
-                                    "client_secret": self._api_secret,
-                                    "grant_type": "authorization_code",
-                                    "code": auth_code,
-                                    "redirect_uri": redirect_url
-                                })
+        response = self.session.get(url=request_url,
+                                    timeout=self._timeout,
+                                    params={
+                                        "client_id": self._api_key,
+                                        "client_secret": self._api_secret,
+                                        "grant_type": "authorization_code",
+                                        "code": auth_code,
+                                        "redirect_uri": redirect_url
+                                    })
         response.raise_for_status()
         response_item = response.json
         self._set_token_and_renewal(response.json["token"])
 
     def renew_token(self):
         request_url = f'{self._api_base_url}/login/renew'
-        request_headers = {
-            "Content-Type": "application/json",
-            "Authorization": f'Bearer {self._jwt_token}'
-        }
-        response = requests.get(url=request_url,
-                                headers=request_headers
-                                )
+        request_headers = self._get_request_headers()
+        response = self.session.get(url=request_url,
+                                    headers=request_headers,
+                                    timeout=self._timeout
+                                    )
         response.raise_for_status()
         self._set_token_and_renewal(response.text)
 
@@ -230,3 +285,97 @@ class DiscoverTextApi():
             "limit": limit
         }
         return json.loads(self._send_get(request_url, params))
+
+    def _iter_pages(self, fetch_page, page_size, concurrency, offset):
+        '''
+        generator of (offset, page) for a paginated listing. The first page is fetched
+        to learn the total count (meta.count), then the remaining offsets are fetched
+        by a pool of concurrency threads and yielded as they arrive (not in order)
+        '''
+        first_page = fetch_page(offset, page_size)
+        if not first_page:
+            return
+        yield offset, first_page
+
+        remaining_offsets = iter(
+            range(offset + page_size, first_page["meta"]["count"], page_size))
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            in_flight = {executor.submit(fetch_page, this_offset, page_size): this_offset
+                         for this_offset in islice(remaining_offsets, concurrency * 2)}
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    this_offset = in_flight.pop(future)
+                    next_offset = next(remaining_offsets, None)
+                    if next_offset is not None:
+                        in_flight[executor.submit(
+                            fetch_page, next_offset, page_size)] = next_offset
+                    yield this_offset, future.result()
+
+    def iter_archive_unit_pages(self, archive_id, page_size=100, concurrency=4,
+                                include_metadata=True, offset=0):
+        return self._iter_pages(lambda this_offset, limit: self.get_archive_units(
+            archive_id, offset=this_offset, limit=limit, include_metadata=include_metadata),
+            page_size, concurrency, offset)
+
+    def iter_bucket_unit_pages(self, bucket_id, page_size=100, concurrency=4,
+                               include_metadata=True, offset=0):
+        return self._iter_pages(lambda this_offset, limit: self.get_bucket_units(
+            bucket_id, offset=this_offset, limit=limit, include_metadata=include_metadata),
+            page_size, concurrency, offset)
+
+    def _iter_items(self, fetch_page, page_size, prefetch, offset):
+        '''
+        generator of the items of a paginated listing, in order. While the caller works
+        through one page, up to prefetch following pages are requested in the background,
+        and only those pages are held in memory. Listings without a total count
+        (meta.count) are read until a short page
+        '''
+        first_page = fetch_page(offset, page_size)
+        if not first_page:
+            return
+        total_count = first_page.get("meta", {}).get("count")
+        if total_count is None:
+            next_offsets = count(offset + page_size, page_size)
+        else:
+            next_offsets = iter(
+                range(offset + page_size, total_count, page_size))
+
+        with ThreadPoolExecutor(max_workers=max(prefetch, 1)) as executor:
+            pending = deque(executor.submit(fetch_page, this_offset, page_size)
+                            for this_offset in islice(next_offsets, prefetch))
+            try:
+                page = first_page
+                while True:
+                    items = page.get("items") or []
+                    yield from items
+                    if not pending or (total_count is None and len(items) < page_size):
+                        return
+                    page = pending.popleft().result()
+                    if not page:
+                        return
+                    # keep the window full while the caller works through this page
+                    next_offset = next(next_offsets, None)
+                    if next_offset is not None:
+                        pending.append(executor.submit(
+                            fetch_page, next_offset, page_size))
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def iter_archive_units(self, archive_id, page_size=100, prefetch=2,
+                           include_metadata=True, offset=0):
+        return self._iter_items(lambda this_offset, limit: self.get_archive_units(
+            archive_id, offset=this_offset, limit=limit, include_metadata=include_metadata),
+            page_size, prefetch, offset)
+
+    def iter_bucket_units(self, bucket_id, page_size=100, prefetch=2,
+                          include_metadata=True, offset=0):
+        return self._iter_items(lambda this_offset, limit: self.get_bucket_units(
+            bucket_id, offset=this_offset, limit=limit, include_metadata=include_metadata),
+            page_size, prefetch, offset)
+
+    def iter_codeset_data(self, codeset_id, page_size=100, prefetch=2, offset=0):
+        return self._iter_items(lambda this_offset, limit: self.get_codeset_data(
+            codeset_id, offset=this_offset, limit=limit),
+            page_size, prefetch, offset)
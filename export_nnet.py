@@ -0,0 +1,21 @@
+import argparse
+from nnet_model import NumpyNNet
+from run_nnet import load_nnet
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--nnetmodel", help="Keras NNet model file")
+    parser.add_argument("-o", "--output", help="output numpy nnet model file")
+    args = parser.parse_args()
+
+    if not args.nnetmodel:
+        raise "missing nnet model file"
+    if not args.output:
+        raise "missing output file"
+
+    nnet = load_nnet(args.nnetmodel)
+    if isinstance(nnet, NumpyNNet):
+        raise "nnet model is already a numpy nnet model"
+
+    print(f'exporting {args.nnetmodel} to {args.output}...')
+    NumpyNNet.from_keras(nnet).save(args.output)
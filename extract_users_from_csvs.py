@@ -1,17 +1,20 @@
 import argparse
+import multiprocessing
 from datetime import datetime, timezone
 import glob
 import pandas as pd
 import os
-import timestring
-from utils import batch_list
 from nltk import word_tokenize
-from utils import get_hashtag_count, get_list_item_count, get_url_count, get_twitter_auth
-import tweepy
+from utils import get_hashtag_count, get_list_item_count, get_url_count, get_twitter_auth_list
+from utils import get_bio_feature_frame, parse_created_at, get_num_days
+from utils import get_metrics, add_metrics_arguments, start_metrics, finish_metrics
+from twitter_lookup import TwitterUserLookup, TwitterUserCache
 
 SCREEN_NAME_COLUMN = 'Value'
+# number of looked up users whose records are computed together
+USER_RECORDS_BATCH_SIZE = 5000
 
-twitter_api = None
+twitter_lookup = None
 
 
 def get_user_add_props(input_bio):
@@ -36,46 +39,48 @@ def get_val(user_object, attribute_name):
 
 
 def get_twitter_api_batch(this_batch):
-    retry_count = 0
-    while True:
-        try:
-            user_data = twitter_api.lookup_users(screen_name=this_batch)
-            return user_data
-        except Exception as e:
-            retry_count += 1
-            if (retry_count > 3):
-                print(
-                    f'!! exception getting Twitter API data... retry {retry_count} of 3...')
-            else:
-                print(f'exception: {e}')
-                print('... too many retrys... skipping...')
-                return None
+    return twitter_lookup.lookup_batch(this_batch)
 
 
 def get_batched_user_data(this_batch, todays_date):
-    ret = []
-    user_data = get_twitter_api_batch(this_batch)
+    return get_user_records(get_twitter_api_batch(this_batch), todays_date)
+
+
+def get_user_records(user_data, todays_date, workers=1, pool=None):
+    '''
+    builds the output record of each looked up user, skipping those without a
+    readable creation date. The bio features and the dates of the whole batch are
+    computed together (see get_bio_feature_frame), with workers processes
+    '''
     if not user_data:
         return []
-    for this_user in user_data:
-        user_create_date_str = get_val(this_user, "created_at")
-        if not user_create_date_str:
-            continue
+    users = list(user_data)
+    user_create_dates = parse_created_at(
+        [get_val(this_user, "created_at") for this_user in users])
+    has_date = user_create_dates.notna().to_numpy()
+    if not has_date.all():
+        num_skipped = len(users) - int(has_date.sum())
+        print(
+            f'... skipping {num_skipped} users without a readable creation date')
+        get_metrics().count("users_skipped", num_skipped)
+        users = [this_user for this_user, this_has_date in zip(users, has_date)
+                 if this_has_date]
+        user_create_dates = user_create_dates[has_date].reset_index(drop=True)
+    if not users:
+        return []
 
-        user_create_date = timestring.Date(user_create_date_str)
+    all_num_days = get_num_days(user_create_dates, todays_date).tolist()
+    df_bio_features = get_bio_feature_frame(
+        [get_val(this_user, "description") for this_user in users], workers, pool)
 
+    ret = []
+    for this_user, user_create_date, num_days, bio_features in zip(users, user_create_dates.tolist(), all_num_days,
+                                                                   df_bio_features.itertuples(index=False)):
         num_statuses = int(get_val(this_user, "statuses_count"))
         follower_count = int(get_val(this_user, "followers_count"))
         following_count = int(get_val(this_user, "friends_count"))
         location = get_val(this_user, "location")
 
-        num_days = (todays_date - user_create_date.date).days
-        if num_days == 0:
-            num_days = 1
-
-        desc_len_terms, desc_len_chars, num_list_items, num_hashtags, url_count = get_user_add_props(
-            get_val(this_user, "description"))
-
         ret_user = {
             "userid": get_val(this_user, "id"),
             "user_display_name": get_val(this_user, "name"),
@@ -91,11 +96,11 @@ def get_batched_user_data(this_batch, todays_date):
             "statuses_per_day": num_statuses / num_days,
             "followers_per_day": follower_count / num_days,
             "following_per_day": following_count / num_days,
-            "desc_len_terms": desc_len_terms,
-            "desc_len_chars": desc_len_chars,
-            "num_list_items": num_list_items,
-            "num_hashtags": num_hashtags,
-            "url_count": url_count,
+            "desc_len_terms": bio_features.desc_len_terms,
+            "desc_len_chars": bio_features.desc_len_chars,
+            "num_list_items": bio_features.num_list_items,
+            "num_hashtags": bio_features.num_hashtags,
+            "url_count": bio_features.url_count,
             "has_location": 1 if location else 0,
             "verified": get_val(this_user, "verified")
         }
@@ -103,17 +108,32 @@ def get_batched_user_data(this_batch, todays_date):
     return ret
 
 
-def get_user_data(screen_names):
+def get_user_data(screen_names, workers=1, pool=None):
     ret = []
+    metrics = get_metrics()
     todays_date = datetime.now(timezone.utc)
-    for this_batch in batch_list(screen_names, 100):
-        print(
-            f'...getting batch of {len(this_batch)} from "{this_batch[0]}" to "{this_batch[-1]}"...')
-        twitter_batch_data = get_batched_user_data(this_batch, todays_date)
+    pending_users = []
+
+    def add_pending_records():
+        with metrics.timer("user_records"):
+            twitter_batch_data = get_user_records(
+                pending_users, todays_date, workers, pool)
+        metrics.count("users_found", len(twitter_batch_data))
         print(f'... got user data for {len(twitter_batch_data)} users...')
-        if twitter_batch_data:
-            ret.extend(twitter_batch_data)
+        ret.extend(twitter_batch_data)
+        pending_users.clear()
         print(f'... gotten so far: {len(ret)}')
+
+    for this_batch, user_data in metrics.timed_iter("twitter_lookup", twitter_lookup.lookup(screen_names)):
+        print(
+            f'...got batch of {len(this_batch)} from "{this_batch[0]}" to "{this_batch[-1]}"...')
+        metrics.count("users_looked_up", len(this_batch))
+        if user_data:
+            pending_users.extend(user_data)
+        if len(pending_users) >= USER_RECORDS_BATCH_SIZE:
+            add_pending_records()
+    if pending_users:
+        add_pending_records()
     return ret
 
 
@@ -122,6 +142,14 @@ if __name__ == "__main__":
     parser.add_argument("-i", "--input", help="input directory or file")
     parser.add_argument("-o", "--output", help="output file")
     parser.add_argument("-c", "--credentials", help="twitter credentials file")
+    parser.add_argument("-t", "--concurrency", type=int, default=2,
+                        help="concurrent requests per set of twitter credentials")
+    parser.add_argument("--cache", help="user profile cache file (sqlite)")
+    parser.add_argument("--cache-ttl", type=float, default=24,
+                        help="hours before a cached user profile is refetched")
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                        help="number of processes computing the user bio features")
+    add_metrics_arguments(parser)
     args = parser.parse_args()
 
     if not args.input:
@@ -131,12 +159,19 @@ if __name__ == "__main__":
     if not args.credentials:
         raise "missing credentials file"
 
-    twitter_app_auth = get_twitter_auth(args.credentials)
-    twitter_auth = tweepy.OAuthHandler(
-        twitter_app_auth["consumer_key"], twitter_app_auth["consumer_secret"])
-    twitter_auth.set_access_token(
-        twitter_app_auth["access_token"], twitter_app_auth["access_secret"])
-    twitter_api = tweepy.API(twitter_auth, wait_on_rate_limit=True)
+    start_metrics(args)
+    metrics = get_metrics()
+
+    # started before the lookups start their threads, and used for every batch
+    bio_pool = multiprocessing.Pool(args.workers) if args.workers > 1 else None
+
+    user_cache = None
+    if args.cache:
+        user_cache = TwitterUserCache(
+            args.cache, ttl_seconds=args.cache_ttl * 60 * 60)
+    twitter_lookup = TwitterUserLookup(get_twitter_auth_list(args.credentials),
+                                       concurrency_per_token=args.concurrency,
+                                       cache=user_cache)
 
     if os.path.isdir(args.input):
         all_files = glob.glob(os.path.join(args.input, "*.csv"))
@@ -151,7 +186,10 @@ if __name__ == "__main__":
     f_counter = 0
     for this_file in all_files:
         print(f'... reading {this_file}')
-        df = pd.read_csv(this_file, keep_default_na=False)
+        with metrics.timer("read_csv"):
+            df = pd.read_csv(this_file, keep_default_na=False)
+        metrics.count("rows_read", len(df.index))
+        metrics.count_file_bytes("input_bytes", this_file)
         for index, row in df.iterrows():
             this_screen_name = row[SCREEN_NAME_COLUMN]
             if this_screen_name not in screen_names:
@@ -160,9 +198,25 @@ if __name__ == "__main__":
         print(f'... processed {f_counter} of {all_file_len}')
 
     print(f'Found a total of {len(screen_names)} users')
-
-    all_users = get_user_data(screen_names.keys())
+    metrics.count("screen_names", len(screen_names))
+
+    try:
+        all_users = get_user_data(screen_names.keys(), args.workers, bio_pool)
+    finally:
+        if bio_pool:
+            bio_pool.close()
+            bio_pool.join()
     print(f'total output of {len(all_users)} users...')
-
-    df_out = pd.DataFrame(all_users)
-    df_out.to_csv(args.output)
+    if user_cache:
+        print(
+            f'... user cache: {user_cache.hits} hits, {user_cache.misses} misses')
+        metrics.count("user_cache_hits", user_cache.hits)
+        metrics.count("user_cache_misses", user_cache.misses)
+        user_cache.close()
+
+    with metrics.timer("write_csv"):
+        df_out = pd.DataFrame(all_users)
+        df_out.to_csv(args.output)
+    metrics.count("rows_written", len(df_out.index))
+    metrics.count_file_bytes("output_bytes", args.output)
+    finish_metrics(args)
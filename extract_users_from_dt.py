@@ -1,9 +1,19 @@
 import argparse
 import collections
+import json
+import os
 from discovertext_api import DiscoverTextApi
 import pandas as pd
+from utils import get_metrics, add_metrics_arguments, start_metrics, finish_metrics
 
 dt_api = None
+page_size = 100
+concurrency = 4
+checkpoint_dir = "."
+checkpoint_interval = 50
+resume = False
+incremental = False
+delta_output_file = None
 
 
 def print_item_list(item_list):
@@ -14,48 +24,251 @@ def print_item_list(item_list):
     print("----")
 
 
+def get_unit_screen_names(unit):
+    if not "metadata" in unit:
+        return []
+    return [x["value"] for x in unit["metadata"]
+            if (x["key"].startswith("screen_name") or
+                x["key"].startswith("from_user") or
+                x["key"].startswith("entities_mentions_username"))]
+
+
+def get_checkpoint_path(entity_type, entity_id):
+    return os.path.join(checkpoint_dir, f'dt_{entity_type}_{entity_id}.checkpoint.jsonl')
+
+
+def load_checkpoint(entity_type, entity_id):
+    '''
+    returns (offset, screen_names) from the checkpoints of this archive/bucket, or
+    None when there are none. The checkpoint lines are then compacted into one, so
+    the file doesn't keep growing over several resumed runs
+    '''
+    checkpoint_path = get_checkpoint_path(entity_type, entity_id)
+    if not os.path.exists(checkpoint_path):
+        return None
+    offset = None
+    screen_names = collections.Counter()
+    num_lines = 0
+    is_cut_short = False
+    with open(checkpoint_path, encoding='utf8') as checkpoint_file:
+        for this_line in checkpoint_file:
+            try:
+                checkpoint = json.loads(this_line)
+            except ValueError:
+                # a line cut short by a crash while saving, the lines before it stand
+                is_cut_short = True
+                break
+            offset = checkpoint["offset"]
+            screen_names.update(checkpoint["screen_names"])
+            num_lines += 1
+    if offset is None:
+        return None
+    if num_lines > 1 or is_cut_short:
+        temp_path = f'{checkpoint_path}.tmp'
+        with open(temp_path, 'w', encoding='utf8') as checkpoint_file:
+            checkpoint_file.write(get_checkpoint_line(
+                entity_type, entity_id, offset, screen_names))
+        os.replace(temp_path, checkpoint_path)
+    return offset, screen_names
+
+
+def get_checkpoint_line(entity_type, entity_id, offset, screen_names):
+    return json.dumps({
+        "entity_type": entity_type,
+        "entity_id": entity_id,
+        "offset": offset,
+        "screen_names": screen_names
+    }) + "\n"
+
+
+def save_checkpoint(entity_type, entity_id, offset, new_screen_names):
+    '''
+    saves the offset reached and the names counted since the previous checkpoint.
+    Checkpoints are appended as json lines, so each one costs only the names counted
+    since the last, however many names have been gathered
+    '''
+    checkpoint_path = get_checkpoint_path(entity_type, entity_id)
+    with open(checkpoint_path, 'a', encoding='utf8') as checkpoint_file:
+        checkpoint_file.write(get_checkpoint_line(
+            entity_type, entity_id, offset, new_screen_names))
+
+
+def remove_checkpoint(entity_type, entity_id):
+    checkpoint_path = get_checkpoint_path(entity_type, entity_id)
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+
+def get_state_path(entity_type, entity_id):
+    return os.path.join(checkpoint_dir, f'dt_{entity_type}_{entity_id}.state.json')
+
+
+def load_high_water_mark(entity_type, entity_id):
+    '''
+    returns (offset, output_filename): the number of units extracted from this
+    archive/bucket by previous incremental runs and the file their names were
+    written to, (0, None) when there has been none
+    '''
+    state_path = get_state_path(entity_type, entity_id)
+    if not os.path.exists(state_path):
+        return 0, None
+    with open(state_path, encoding='utf8') as state_file:
+        state = json.load(state_file)
+    return state["offset"], state.get("output")
+
+
+def save_high_water_mark(entity_type, entity_id, offset, output_filename):
+    state_path = get_state_path(entity_type, entity_id)
+    temp_path = f'{state_path}.tmp'
+    with open(temp_path, 'w', encoding='utf8') as state_file:
+        json.dump({
+            "entity_type": entity_type,
+            "entity_id": entity_id,
+            "offset": offset,
+            "output": output_filename
+        }, state_file)
+    os.replace(temp_path, state_path)
+
+
+def load_screen_names(input_filename):
+    '''
+    reads the Value/Total totals of a previous extraction output file
+    '''
+    screen_names = collections.Counter()
+    if not os.path.exists(input_filename):
+        return screen_names
+    # read as text, so names like 007 aren't turned into numbers
+    df = pd.read_csv(input_filename, keep_default_na=False, encoding='utf8',
+                     dtype={"Value": str})
+    if "Value" in df.columns:
+        screen_names.update(dict(zip(df["Value"], df["Total"])))
+    return screen_names
+
+
+def save_screen_names(screen_names, output_filename):
+    df = pd.DataFrame.from_dict(screen_names, orient='index').reset_index()
+    df = df.rename(columns={'index': 'Value', 0: 'Total'})
+    df.to_csv(output_filename, encoding='utf8')
+
+
 def extract_and_save(project_id, entity_type, entity_id, entity_name, output_file=None):
+    # incremental runs start after the units extracted by the previous run
+    metrics = get_metrics()
+    start_offset, previous_output = load_high_water_mark(
+        entity_type, entity_id) if incremental else (0, None)
     screen_names = collections.Counter()
-    current_offset = 0
-    while True:
+    if start_offset:
+        print(f"extracting units from offset {start_offset}")
+    checkpoint = load_checkpoint(entity_type, entity_id) if resume else None
+    if checkpoint:
+        start_offset, screen_names = checkpoint
+        print(
+            f"resuming from offset {start_offset} with {len(screen_names)} names")
+    else:
+        # checkpoints are appended, so any left by an earlier run must go
+        remove_checkpoint(entity_type, entity_id)
+    # the names counted since the last checkpoint, added to screen_names at each one
+    new_screen_names = collections.Counter()
+
+    if concurrency <= 1:
+        # one request at a time, in order: the next pages are prefetched while
+        # the current one is processed
         if entity_type == "archive":
-            current_units = dt_api.get_archive_units(
-                entity_id, offset=current_offset, limit=100, include_metadata=True)
+            units = dt_api.iter_archive_units(
+                entity_id, page_size=page_size, include_metadata=True, offset=start_offset)
         elif entity_type == "bucket":
-            current_units = dt_api.get_bucket_units(
-                entity_id, offset=current_offset, limit=100, include_metadata=True)
-        if not current_units:
-            break
-        max_limit = current_units["meta"]["count"]
-        print(f"offset {current_offset} out of {max_limit}")
-
-        if not "items" in current_units:
-            break
-        for this_item in current_units["items"]:
-            if not "metadata" in this_item:
-                continue
-            screen_name_list = list(
-                filter(lambda x: (x["key"].startswith("screen_name") or
-                                  x["key"].startswith("from_user") or
-                                  x["key"].startswith("entities_mentions_username")),
-                       this_item["metadata"]))
-            for name in screen_name_list:
-                screen_names.update({name["value"]: 1})
-
-        current_offset += 100
-        if current_offset >= max_limit:
-            break
-
+            units = dt_api.iter_bucket_units(
+                entity_id, page_size=page_size, include_metadata=True, offset=start_offset)
+
+        unit_count = 0
+        for unit_count, this_item in enumerate(metrics.timed_iter("dt_fetch", units), 1):
+            new_screen_names.update(get_unit_screen_names(this_item))
+            if unit_count % page_size == 0:
+                print(f"read {start_offset + unit_count} units")
+                if unit_count % (page_size * checkpoint_interval) == 0:
+                    with metrics.timer("save_checkpoint"):
+                        save_checkpoint(entity_type, entity_id,
+                                        start_offset + unit_count, new_screen_names)
+                    screen_names.update(new_screen_names)
+                    new_screen_names.clear()
+        end_offset = start_offset + unit_count
+        metrics.count("units_read", unit_count)
+    else:
+        if entity_type == "archive":
+            unit_pages = dt_api.iter_archive_unit_pages(
+                entity_id, page_size=page_size, concurrency=concurrency,
+                include_metadata=True, offset=start_offset)
+        elif entity_type == "bucket":
+            unit_pages = dt_api.iter_bucket_unit_pages(
+                entity_id, page_size=page_size, concurrency=concurrency,
+                include_metadata=True, offset=start_offset)
+
+        # pages arrive out of order as the concurrent requests complete, so names are
+        # held per page until every page before them is in; the checkpoint then only
+        # covers the contiguous offsets done
+        next_offset = start_offset
+        page_names = {}
+        pages_since_checkpoint = 0
+        end_offset = start_offset
+        for current_offset, current_units in metrics.timed_iter("dt_fetch", unit_pages):
+            max_limit = current_units["meta"]["count"]
+            print(f"offset {current_offset} out of {max_limit}")
+
+            page_names[current_offset] = collections.Counter()
+            current_items = current_units.get("items", [])
+            end_offset = max(end_offset, current_offset + len(current_items))
+            metrics.count("pages_read")
+            metrics.count("units_read", len(current_items))
+            for this_item in current_items:
+                page_names[current_offset].update(
+                    get_unit_screen_names(this_item))
+
+            while next_offset in page_names:
+                new_screen_names.update(page_names.pop(next_offset))
+                next_offset += page_size
+                pages_since_checkpoint += 1
+            if pages_since_checkpoint >= checkpoint_interval:
+                with metrics.timer("save_checkpoint"):
+                    save_checkpoint(entity_type, entity_id,
+                                    next_offset, new_screen_names)
+                screen_names.update(new_screen_names)
+                new_screen_names.clear()
+                pages_since_checkpoint = 0
+
+    screen_names.update(new_screen_names)
     print(f'Completed {entity_type}: "{entity_name}"')
     if output_file:
         output_filename = output_file
     else:
         output_filename = input(
             f"Gathered {len(screen_names)} total names. Output file: ")
+
+    if incremental:
+        print(
+            f'Extracted {end_offset - start_offset} new units with {len(screen_names)} names')
+        if delta_output_file:
+            print(f'Writing new names to: {delta_output_file}')
+            save_screen_names(screen_names, delta_output_file)
+        # merge this run's totals into the previous run's output, which holds the names
+        # of the units before the high-water mark, even when writing to a new file
+        if previous_output:
+            if os.path.abspath(previous_output) != os.path.abspath(output_filename):
+                print(
+                    f'Merging the totals of the previous run from: {previous_output}')
+            if not os.path.exists(previous_output):
+                raise f'previous output {previous_output} not found, run without -n to extract everything again'
+            with metrics.timer("read_csv"):
+                screen_names = load_screen_names(previous_output) + screen_names
+
     print(f'Writing output to: {output_filename}')
-    df = pd.DataFrame.from_dict(screen_names, orient='index').reset_index()
-    df = df.rename(columns={'index': 'Value', 0: 'Total'})
-    df.to_csv(output_filename, encoding='utf8')
+    with metrics.timer("write_csv"):
+        save_screen_names(screen_names, output_filename)
+    metrics.count("screen_names", len(screen_names))
+    metrics.count_file_bytes("output_bytes", output_filename)
+    if incremental:
+        save_high_water_mark(entity_type, entity_id,
+                             end_offset, output_filename)
+    remove_checkpoint(entity_type, entity_id)
 
 
 def extract_from_archive(project_id, bucket_id, bucket_name):
@@ -194,12 +407,37 @@ if __name__ == "__main__":
     parser.add_argument("-a", "--archive", help="archive to extract from")
     parser.add_argument("-b", "--bucket", help="bucket to extract from")
     parser.add_argument("-o", "--output", help="output file")
+    parser.add_argument("-p", "--pagesize", type=int, default=100,
+                        help="number of units per page request")
+    parser.add_argument("-c", "--concurrency", type=int, default=4,
+                        help="number of page requests in flight at once (1 reads pages in order, prefetching ahead)")
+    parser.add_argument("--checkpoint-dir", default=".",
+                        help="directory for extraction checkpoints and incremental state")
+    parser.add_argument("--checkpoint-interval", type=int, default=50,
+                        help="number of pages between checkpoints")
+    parser.add_argument("-r", "--resume", action="store_true",
+                        help="resume from the last checkpoint of the archive/bucket")
+    parser.add_argument("-n", "--incremental", action="store_true",
+                        help="only extract units added since the last incremental run, merging into the output file")
+    parser.add_argument("-d", "--delta", help="incremental: also write the names found by this run to this file")
+    add_metrics_arguments(parser)
     args = parser.parse_args()
 
+    page_size = args.pagesize
+    concurrency = args.concurrency
+    checkpoint_dir = args.checkpoint_dir
+    checkpoint_interval = args.checkpoint_interval
+    resume = args.resume
+    incremental = args.incremental
+    delta_output_file = args.delta
+
     if not args.input:
         raise "missing input credential file"
 
-    dt_api = DiscoverTextApi(credential_file=args.input)
+    start_metrics(args)
+
+    dt_api = DiscoverTextApi(credential_file=args.input,
+                             pool_size=max(args.concurrency, 10))
 
     dt_api.login()
 
@@ -221,3 +459,5 @@ if __name__ == "__main__":
             reverse=True)
 
         do_project_select(project_list)
+
+    finish_metrics(args)
@@ -1,18 +1,71 @@
 import argparse
+import json
+import multiprocessing
 from collections import Counter
 from nltk.corpus import stopwords
 from utils import clean_text, tokenize, get_urls, get_hashtags
-from sklearn.feature_extraction.text import CountVectorizer
 import pandas as pd
 
-stop_words = stopwords.words('english')
+TEXT_COLUMN = "user_profile_description"
+
+stop_words = frozenset(stopwords.words('english'))
 
 
 class StatsCorpus():
+    '''
+    term, hashtag and url counts of a set of bios. Stats gathered separately (from
+    chunks of a file, or from different runs, see save and load) can be merged
+    with update
+    '''
+
     def __init__(self):
-        self._corpus = []
-        self._total_terms = 0
-        self._unique_terms = Counter()
+        self.num_bios = 0
+        self.term_counter = Counter()
+        self.hashtag_counter = Counter()
+        self.url_counter = Counter()
+
+    def add_text(self, input_text):
+        if not input_text:
+            return
+        self.num_bios += 1
+
+        urls = get_urls(input_text)
+        hashtags = get_hashtags(input_text)
+        cleaned = clean_text(input_text, remove_urls=True)
+        tokens = tokenize(cleaned)
+        if len(tokens) == 0:
+            return
+        tokens = [x for x in tokens if x not in stop_words]
+        self.term_counter.update(get_tokens_for_counting(tokens))
+
+        self.url_counter.update(url.lower() for url in urls)
+        self.hashtag_counter.update(hashtag.lower() for hashtag in hashtags)
+
+    def update(self, other):
+        self.num_bios += other.num_bios
+        self.term_counter.update(other.term_counter)
+        self.hashtag_counter.update(other.hashtag_counter)
+        self.url_counter.update(other.url_counter)
+
+    def save(self, output_path):
+        with open(output_path, 'w', encoding='utf8') as output_file:
+            json.dump({
+                "num_bios": self.num_bios,
+                "terms": self.term_counter,
+                "hashtags": self.hashtag_counter,
+                "urls": self.url_counter
+            }, output_file)
+
+    @staticmethod
+    def load(input_path):
+        with open(input_path, encoding='utf8') as input_file:
+            saved = json.load(input_file)
+        stats = StatsCorpus()
+        stats.num_bios = saved["num_bios"]
+        stats.term_counter = Counter(saved["terms"])
+        stats.hashtag_counter = Counter(saved["hashtags"])
+        stats.url_counter = Counter(saved["urls"])
+        return stats
 
 
 def is_number(s):
@@ -34,43 +87,81 @@ def get_tokens_for_counting(tokens):
     return ret
 
 
+def get_text_stats(text_items):
+    stats = StatsCorpus()
+    for this_text in text_items:
+        stats.add_text(this_text)
+    return stats
+
+
+def get_file_stats(input_path, chunksize=10000, workers=1):
+    '''
+    gathers the stats of a csv file of bios, reading it chunksize rows at a time.
+    With workers > 1 the chunks are counted by a process pool and merged as they
+    complete
+    '''
+    text_chunks = (df[TEXT_COLUMN].astype(str).tolist()
+                   for df in pd.read_csv(input_path, keep_default_na=False,
+                                         usecols=[TEXT_COLUMN], chunksize=chunksize))
+    stats = StatsCorpus()
+    if workers > 1:
+        with multiprocessing.Pool(workers) as pool:
+            for chunk_stats in pool.imap_unordered(get_text_stats, text_chunks):
+                stats.update(chunk_stats)
+    else:
+        for text_items in text_chunks:
+            stats.update(get_text_stats(text_items))
+    return stats
+
+
+def get_report(stats, top_n=100):
+    term_counter = stats.term_counter
+    hashtag_counter = stats.hashtag_counter
+    return "\n".join([
+        f'top {top_n} terms:',
+        str(term_counter.most_common(top_n)),
+        f'{len(term_counter)} unique, {sum(term_counter.values())} total',
+        f'top {top_n} urls:',
+        str(stats.url_counter.most_common(top_n)),
+        f'top {top_n} hashtags:',
+        str(hashtag_counter.most_common(top_n)),
+        f'{len(hashtag_counter)} unique, {sum(hashtag_counter.values())} total'
+    ])
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("-i", "--input", help="input csv file")
+    parser.add_argument("-m", "--merge", nargs="+", default=[],
+                        help="saved stats files (see --save) to add to the report")
+    parser.add_argument("-s", "--save",
+                        help="save the combined stats to this file, to be merged in later runs")
+    parser.add_argument("-o", "--output",
+                        help="write the report to this file instead of the console")
+    parser.add_argument("-t", "--top", type=int, default=100,
+                        help="number of top terms, urls and hashtags reported")
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                        help="number of processes counting the input")
+    parser.add_argument("-c", "--chunksize", type=int, default=10000,
+                        help="number of rows read and counted at a time")
     args = parser.parse_args()
 
-    df = pd.read_csv(args.input, keep_default_na=False)
-    term_counter = Counter()
-    hashtag_counter = Counter()
-    url_counter = Counter()
-    for index, row in df.iterrows():
-        input_text = str(row["user_profile_description"])
-        if not input_text:
-            continue
-
-        urls = get_urls(input_text)
-        hashtags = get_hashtags(input_text)
-        cleaned = clean_text(input_text, remove_urls=True)
-        tokens = tokenize(cleaned)
-        if len(tokens) == 0:
-            continue
-        tokens = [x for x in tokens if x not in stop_words]
-        tokens_for_count = get_tokens_for_counting(tokens)
-        for token in tokens_for_count:
-            term_counter[token] += 1
-
-        for url in urls:
-            url_counter[url.lower()] += 1
-        for hashtag in hashtags:
-            hashtag_counter[hashtag.lower()] += 1
+    if not args.input and not args.merge:
+        raise "missing input file or saved stats to merge"
 
-    print('top 100 terms:')
-    print(term_counter.most_common(100))
-    print(f'{len(term_counter)} unique, {sum(term_counter.values())} total')
+    stats = StatsCorpus()
+    if args.input:
+        stats.update(get_file_stats(
+            args.input, args.chunksize, args.workers))
+    for this_file in args.merge:
+        stats.update(StatsCorpus.load(this_file))
 
-    print('top 100 urls:')
-    print(url_counter.most_common(100))
+    if args.save:
+        stats.save(args.save)
 
-    print("top 100 hashtags:")
-    print(hashtag_counter.most_common(100))
-    print(f'{len(hashtag_counter)} unique, {sum(hashtag_counter.values())} total')
+    report = get_report(stats, args.top)
+    if args.output:
+        with open(args.output, 'w', encoding='utf8') as output_file:
+            output_file.write(report + "\n")
+    else:
+        print(report)
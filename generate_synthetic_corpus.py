@@ -0,0 +1,100 @@
+import argparse
+import numpy as np
+import pandas as pd
+
+TEXT_COLUMN = "user_profile_description"
+CLASS_COLUMN = "class_value"
+
+DEFAULT_INPUTS = ["./resources/training_bot.csv",
+                  "./resources/training_good.csv"]
+
+
+def load_source(input_files):
+    '''
+    reads the labelled user data to sample from, dropping the saved index columns
+    and the rows without a bio or class. Carriage returns in the bios become newlines,
+    as to_csv only quotes the values holding its own line terminator
+    '''
+    df = pd.concat([pd.read_csv(this_file, keep_default_na=False)
+                    for this_file in input_files], ignore_index=True)
+    df = df.loc[:, ~df.columns.str.startswith("Unnamed")]
+    df = df[(df[TEXT_COLUMN].astype(str).str.len() > 0) &
+            (df[CLASS_COLUMN].astype(str).str.len() > 0)]
+    df[TEXT_COLUMN] = df[TEXT_COLUMN].astype(
+        str).str.replace("\r\n?", "\n", regex=True)
+    if "verified" not in df.columns:
+        df["verified"] = False
+    return df.reset_index(drop=True)
+
+
+def mix_bios(bios, partner_bios, mix_flags):
+    '''
+    joins the first half of the words of each flagged bio to the second half of the
+    words of its partner bio, so the corpus isn't just the source bios repeated
+    '''
+    ret = []
+    for this_bio, partner_bio, mix in zip(bios, partner_bios, mix_flags):
+        if not mix:
+            ret.append(this_bio)
+            continue
+        words = this_bio.split()
+        partner_words = partner_bio.split()
+        ret.append(" ".join(words[:len(words) // 2] +
+                            partner_words[len(partner_words) // 2:]))
+    return ret
+
+
+def generate_chunk(df_source, class_rows, num_rows, rng, mix_fraction):
+    '''
+    samples num_rows users from df_source, with replacement, mixing each sampled
+    bio with another bio of the same class mix_fraction of the time. The other
+    columns (including the bio features) are those of the sampled row
+    '''
+    df_chunk = df_source.iloc[rng.integers(
+        0, len(df_source.index), num_rows)].reset_index(drop=True)
+
+    classes = df_chunk[CLASS_COLUMN].to_numpy()
+    partners = np.zeros(num_rows, dtype=np.intp)
+    for class_label, these_rows in class_rows.items():
+        in_class = classes == class_label
+        partners[in_class] = rng.choice(these_rows, in_class.sum())
+
+    source_bios = df_source[TEXT_COLUMN].astype(str).to_numpy()
+    df_chunk[TEXT_COLUMN] = mix_bios(df_chunk[TEXT_COLUMN].astype(str).tolist(),
+                                     source_bios[partners].tolist(),
+                                     rng.random(num_rows) < mix_fraction)
+    return df_chunk
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--input", nargs="+", default=DEFAULT_INPUTS,
+                        help="labelled user data csv files to sample from")
+    parser.add_argument("-o", "--output", help="output csv file")
+    parser.add_argument("-n", "--rows", type=int, default=1000000,
+                        help="number of rows to generate")
+    parser.add_argument("-m", "--mix", type=float, default=0.5,
+                        help="fraction of the bios mixed with another bio of the same class")
+    parser.add_argument("-s", "--seed", type=int, default=0,
+                        help="random seed, the same seed and inputs generate the same corpus")
+    parser.add_argument("-c", "--chunksize", type=int, default=100000,
+                        help="number of rows generated and written at a time")
+    args = parser.parse_args()
+
+    if not args.output:
+        raise "missing output file"
+
+    df_source = load_source(args.input)
+    class_rows = {class_label: np.flatnonzero(df_source[CLASS_COLUMN].to_numpy() == class_label)
+                  for class_label in df_source[CLASS_COLUMN].unique()}
+    rng = np.random.default_rng(args.seed)
+
+    rows_written = 0
+    while rows_written < args.rows:
+        num_rows = min(args.chunksize, args.rows - rows_written)
+        df_chunk = generate_chunk(
+            df_source, class_rows, num_rows, rng, args.mix)
+        df_chunk.to_csv(args.output, mode='w' if rows_written == 0 else 'a',
+                        header=rows_written == 0, index=False)
+        rows_written += num_rows
+        print(f'... wrote {rows_written} rows')
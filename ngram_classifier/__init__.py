@@ -1,2 +1,3 @@
 from .ngram_classifier import NGramClassifier
 from .ngram_classifier_record import NGramClassifierRecord
+from .ngram_compiled_model import NGramCompiledModel
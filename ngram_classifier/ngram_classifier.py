@@ -1,22 +1,94 @@
 import pickle
 import math
+import multiprocessing
+import queue
+import numpy as np
 from .ngram_classifier_record import NGramClassifierRecord
-from collections import Counter
+from .ngram_compiled_model import NGramCompiledModel
+from collections import Counter, OrderedDict
 from collections.abc import Sequence
 import utils as text_utils
+from utils import get_metrics
+
+# the classifier shared with scoring worker processes, see classify_text_matrix
+_worker_classifier = None
+
+
+def _init_classify_worker(classifier):
+    global _worker_classifier
+    _worker_classifier = classifier
+
+
+def _classify_shard(args):
+    text_list, is_cleaned = args
+    return _worker_classifier._score_texts(text_list, is_cleaned)
+
+
+def _score_nval(args):
+    cleaned_texts, scale_factors, nval = args
+    return _worker_classifier._get_compiled().get_nval_ratios(cleaned_texts, scale_factors, nval)
+
+
+def _count_texts(text_items, class_designations, class_counts):
+    '''
+    adds the ngram counts of the labelled texts to class_counts, a dictionary of
+    { class_label: { nval: Counter } } holding the tables to count. Texts of
+    other classes are skipped
+    '''
+    for this_text, class_label in zip(text_items, class_designations):
+        these_counts = class_counts.get(class_label)
+        if not these_counts:
+            continue
+        joined = "".join(text_utils.clean_text(this_text).split())
+        for nval, ngram_counts in these_counts.items():
+            if len(joined) >= nval:
+                ngram_counts.update([joined[i:i + nval]
+                                     for i in range(len(joined) - nval + 1)])
+
+
+def _count_rows_worker(worker_index, class_counts, chunk_queue, result_queue):
+    '''
+    training worker process: counts the rows of every chunk slice it reads from
+    chunk_queue into its own tables, then sends them back, with its index, when
+    it reads None
+    '''
+    try:
+        while True:
+            chunk = chunk_queue.get()
+            if chunk is None:
+                break
+            _count_texts(chunk[0], chunk[1], class_counts)
+        result_queue.put((worker_index, class_counts))
+    except Exception as error:
+        result_queue.put(error)
+
+
+def _get_worker_context():
+    # fork lets the workers share the loaded model copy-on-write instead of unpickling it
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context()
 
 
 class NGramClassifier():
 
     def __init__(self, classes=None,
                  model_path=None,
-                 min_len=2, max_len=5
+                 min_len=2, max_len=5,
+                 cache_size=100000
                  ):
 
         self._classes = {}
         self._trained = False
+        self._compiled = None
+        self._read_only = False
         self._min = min_len
         self._max = max_len
+        self._cache_size = cache_size
+        self._cache = OrderedDict()
+        self._pool = None
+        self.cache_hits = 0
+        self.cache_misses = 0
         if model_path:
             self.load(model_path)
             return
@@ -32,28 +104,6 @@ class NGramClassifier():
                 these_classes[nval] = NGramClassifierRecord()
             self._classes[this_class] = these_classes
 
-    def _get_ngrams(self, text, ngram_count):
-        ngram_list = list(text_utils.get_ngrams(text, ngram_count))
-        return list("".join(n) for n in ngram_list)
-
-    def _train_class(self, input_text, class_label):
-        '''
-        trains a class with the input text
-        1) clean the input text
-        2) for each ngram value in _min to _max:
-            2a) get the ngrams for the cleaned text
-            2b) update the ngram list for that class / ngram count
-        '''
-        if class_label not in self._classes:
-            raise f'Unknown class label found: {class_label}'
-
-        cleaned = text_utils.clean_text(input_text)
-        for nval in range(self._min, self._max):
-            if len(cleaned) < nval:
-                continue
-            ngram_list = self._get_ngrams(cleaned, nval)
-            self._classes[class_label][nval].add(ngram_list)
-
     def _get_default_classify_return(self):
         ret = {}
         per_class = 1/len(self._classes.keys())
@@ -66,49 +116,10 @@ class NGramClassifier():
             return 1.0
         return 1.0 / math.pow(math.log(text_length), 2)
 
-    def _calculate_classify_ratios(self, input_text):
-        text_length = len(input_text)
-        scale_factor = self._get_scale_factor(text_length)
-        class_ratios = []
-        for nval in range(self._min, self._max):
-            if len(input_text) < nval:
-                continue
-
-            class_counts = {}
-            overall_count = 0
-            for this_class in self._classes.keys():
-                this_count = self._classes[this_class][nval].total_count
-                overall_count += this_count
-                class_counts[this_class] = this_count
-
-            p = {}
-            for this_class in self._classes.keys():
-                p[this_class] = math.log((class_counts[this_class] + 1) * (
-                    1 - class_counts[this_class] / overall_count) / (class_counts[this_class] + overall_count))
-
-            ngram_list = self._get_ngrams(input_text, nval)
-
-            for this_ngram in ngram_list:
-                count_class = {}
-                for this_class in self._classes.keys():
-                    p_count = 0 if this_ngram not in self._classes[this_class][
-                        nval].ngrams else self._classes[this_class][nval].ngrams[this_ngram]
-                    p_gram = (p_count + 1) / \
-                        (class_counts[this_class] + overall_count)
-                    p[this_class] += math.log(p_gram)
-
-            d = 0.0
-            for this_class in self._classes.keys():
-                p[this_class] *= scale_factor
-                d += math.exp(p[this_class])
-
-            if d != 0.0:
-                vals = {}
-                for this_class in self._classes.keys():
-                    vals[this_class] = math.exp(p[this_class]) / d
-                class_ratios.append(vals)
-
-        return class_ratios
+    def _get_compiled(self):
+        if self._compiled is None:
+            self.compile()
+        return self._compiled
 
     # ----------------------------------------------------------------
     # ----------------------------------------------------------------
@@ -123,63 +134,327 @@ class NGramClassifier():
             ... etc ...
         }
         """
+        return self.classify_text_list([input_text], is_cleaned=is_cleaned)[0]
+
+    def classify_text_list(self, text_list, is_cleaned=False, workers=1):
+        classes = self.get_classes()
+        return [dict(zip(classes, row))
+                for row in self.classify_text_matrix(text_list, is_cleaned=is_cleaned, workers=workers).tolist()]
+
+    def classify_text_matrix(self, text_list, is_cleaned=False, workers=1):
+        """Classify a batch of input text
+
+        text_list can be a list, pandas Series or numpy array of text.
+        Returns a (len(text_list), num_classes) numpy array of class probabilities,
+        with the columns in the order returned by get_classes()
+
+        Each distinct text is cleaned and scored once per batch, and the scores of
+        the most recently seen texts (up to cache_size) are kept between batches.
+        With workers > 1, the texts not already scored are split into shards that
+        are cleaned and scored by a process pool (see start_pool)
+        """
 
         assert(self._trained), "model must be trained before classifying"
+        metrics = get_metrics()
+
+        unique_texts = {}
+        text_rows = np.fromiter((unique_texts.setdefault(this_text, len(unique_texts))
+                                 for this_text in text_list), dtype=np.intp)
+
+        # the cache is keyed by the texts as given, so only the texts it misses
+        # need cleaning, which the pool does when there is one
+        ret = np.empty((len(unique_texts), len(self._classes)))
+        missed_texts = []
+        missed_rows = []
+        for row, this_text in enumerate(unique_texts):
+            cached = self._cache.get(this_text)
+            if cached is None:
+                missed_texts.append(this_text)
+                missed_rows.append(row)
+            else:
+                self._cache.move_to_end(this_text)
+                ret[row] = cached
+
+        if missed_texts:
+            if workers > 1 and len(missed_texts) > workers:
+                with metrics.timer("ngram_lookup"):
+                    scores = self._classify_text_matrix_parallel(
+                        missed_texts, is_cleaned, workers)
+            else:
+                scores = self._score_texts(missed_texts, is_cleaned)
+            ret[missed_rows] = scores
+            self._add_to_cache(missed_texts, scores)
+
+        self.cache_misses += len(missed_texts)
+        self.cache_hits += len(text_rows) - len(missed_texts)
+        metrics.count("ngram_cache_misses", len(missed_texts))
+        metrics.count("ngram_cache_hits", len(text_rows) - len(missed_texts))
+        return ret[text_rows]
+
+    def _score_texts(self, text_list, is_cleaned):
+        # texts that clean to the same text are scored once
+        metrics = get_metrics()
+        with metrics.timer("clean_text"):
+            if is_cleaned:
+                cleaned_list = text_list
+            else:
+                cleaned_list = [text_utils.clean_text(t) for t in text_list]
+        unique_cleaned = {}
+        cleaned_rows = np.fromiter((unique_cleaned.setdefault(this_text, len(unique_cleaned))
+                                    for this_text in cleaned_list), dtype=np.intp,
+                                   count=len(cleaned_list))
+        with metrics.timer("ngram_lookup"):
+            return self._score_cleaned_texts(list(unique_cleaned))[cleaned_rows]
+
+    def _get_scale_factors(self, cleaned_texts):
+        return np.fromiter(map(self._get_scale_factor, map(len, cleaned_texts)),
+                           dtype=np.float64, count=len(cleaned_texts))
+
+    def _score_cleaned_texts(self, cleaned_texts):
+        avgs = self._get_compiled().get_ratio_sums(
+            cleaned_texts, self._get_scale_factors(cleaned_texts))
+        return self._normalize_ratio_sums(cleaned_texts, avgs)
+
+    def _normalize_ratio_sums(self, cleaned_texts, avgs):
+        total_avgs = avgs.sum(axis=1)
+        scorable = (total_avgs != 0.0) & np.fromiter((len(t) >= 2 for t in cleaned_texts),
+                                                     dtype=bool, count=len(cleaned_texts))
+
+        ret = np.full(avgs.shape, 1 / len(self._classes))
+        ret[scorable] = avgs[scorable] / total_avgs[scorable, np.newaxis]
+        return ret
+
+    def classify_text_matrix_ranges(self, text_list, ngram_ranges, is_cleaned=False, workers=1):
+        """Classify a batch of input text with sub-ranges of the trained ngram values
 
+        ngram_ranges is a list of (min_len, max_len) pairs within this classifier's range.
+        Returns a dictionary of { (min_len, max_len): matrix }, each matrix being what
+        classify_text_matrix returns for a classifier trained on the same data with that
+        min_len and max_len, as each ngram value is scored independently. The text is
+        cleaned once and every ngram value is scored once, however many ranges use it;
+        with workers > 1 the ngram values are scored by a process pool (see start_pool)
+        """
+
+        assert(self._trained), "model must be trained before classifying"
+        for min_len, max_len in ngram_ranges:
+            if min_len < self._min or max_len > self._max:
+                raise ValueError(
+                    f'ngram range ({min_len},{max_len}) is outside the trained range ({self._min},{self._max})')
+
+        unique_texts = {}
+        text_rows = np.fromiter((unique_texts.setdefault(this_text, len(unique_texts))
+                                 for this_text in text_list), dtype=np.intp)
         if is_cleaned:
-            cleaned_text = input_text
+            cleaned_texts = list(unique_texts)
         else:
-            cleaned_text = text_utils.clean_text(input_text)
+            cleaned_texts = [text_utils.clean_text(t) for t in unique_texts]
+        scale_factors = self._get_scale_factors(cleaned_texts)
+
+        nvals = sorted({nval for min_len, max_len in ngram_ranges
+                        for nval in range(min_len, max_len)})
+        tasks = [(cleaned_texts, scale_factors, nval) for nval in nvals]
+        if workers > 1 and len(nvals) > 1:
+            nval_ratios = dict(
+                zip(nvals, self.start_pool(workers).map(_score_nval, tasks)))
+        else:
+            compiled = self._get_compiled()
+            nval_ratios = {nval: compiled.get_nval_ratios(*task)
+                           for nval, task in zip(nvals, tasks)}
 
-        if len(cleaned_text) < 2:
-            return self._get_default_classify_return()
+        ret = {}
+        for min_len, max_len in ngram_ranges:
+            avgs = np.zeros((len(cleaned_texts), len(self._classes)))
+            for nval in range(min_len, max_len):
+                avgs += nval_ratios[nval]
+            ret[(min_len, max_len)] = self._normalize_ratio_sums(
+                cleaned_texts, avgs)[text_rows]
+        return ret
 
-        class_ratios = self._calculate_classify_ratios(cleaned_text)
-        if len(class_ratios) == 0:
-            return self._get_default_classify_return()
+    def _classify_text_matrix_parallel(self, text_list, is_cleaned, workers):
+        shard_size = -(-len(text_list) // (workers * 4))
+        shards = [(text_list[start:start + shard_size], is_cleaned)
+                  for start in range(0, len(text_list), shard_size)]
+        return np.vstack(self.start_pool(workers).map(_classify_shard, shards))
 
-        avgs = {}
-        total_avg = 0.0
-        for this_ratio_set in class_ratios:
-            for this_class in self._classes.keys():
-                if not this_class in avgs:
-                    avgs[this_class] = this_ratio_set[this_class]
-                else:
-                    avgs[this_class] += this_ratio_set[this_class]
-                total_avg += this_ratio_set[this_class]
+    def start_pool(self, workers):
+        """Starts the process pool used to classify with workers > 1, and returns it
 
-        if total_avg == 0.0:
-            return self._get_default_classify_return()
+        the pool is started on first use otherwise and is then reused by every call,
+        until close_pool (or until the counts change). Its workers are forked, so
+        programs that also run threads should start the pool before them: a fork
+        while another thread holds a lock can leave the worker deadlocked
+        """
+        if self._pool is None:
+            # compile before starting the pool so every worker inherits the arrays
+            self._get_compiled()
+            self._pool = _get_worker_context().Pool(workers,
+                                                    initializer=_init_classify_worker,
+                                                    initargs=(self,))
+        return self._pool
+
+    def close_pool(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def __getstate__(self):
+        # a pool can't be sent to another process (e.g. when spawning pool workers)
+        state = self.__dict__.copy()
+        state["_pool"] = None
+        return state
+
+    def _add_to_cache(self, cleaned_texts, scores):
+        if self._cache_size <= 0:
+            return
+        for this_text, this_score in zip(cleaned_texts[-self._cache_size:], scores[-self._cache_size:]):
+            self._cache[this_text] = this_score.copy()
+        while len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
 
-        ret = {}
-        for this_class in self._classes.keys():
-            ret[this_class] = avgs[this_class] / total_avg
-        return ret
+    def clear_cache(self):
+        self._cache.clear()
+        self.cache_hits = 0
+        self.cache_misses = 0
 
-    def classify_text_list(self, text_list):
-        return ([self.classify_text(t) for t in text_list])
+    def get_classes(self):
+        return list(self._classes.keys())
 
     # ----------------------------------------------------------------
     # ----------------------------------------------------------------
     # ----------------------------------------------------------------
 
-    def train_text(self, text_items, class_designations):
+    def train_text(self, text_items, class_designations, workers=1):
         assert(len(text_items) == len(class_designations)
                ), "Input arrays must be equal length"
+        self.train_text_chunks([(text_items, class_designations)], workers)
+
+    def train_text_chunks(self, chunks, workers=1):
+        """Trains from an iterable of (text_items, class_designations) chunks
+
+        the chunks can be read lazily (e.g. a pandas read_csv with a chunksize), so
+        only one chunk of training data is held in memory at a time. With workers > 1,
+        the rows of each chunk are split between worker processes, each counting its
+        rows into its own (class, ngram value) tables; the tables of the workers are
+        then merged into the class records
+        """
+        assert(not self._read_only), "compiled models are read-only"
+
+        if workers > 1:
+            self._train_text_chunks_parallel(chunks, workers)
+        else:
+            class_counts = {this_class: {nval: self._classes[this_class][nval].ngrams
+                                         for nval in range(self._min, self._max)}
+                            for this_class in self._classes.keys()}
+            for text_items, class_designations in chunks:
+                self._check_class_labels(class_designations)
+                _count_texts(text_items, class_designations, class_counts)
 
-        for index in range(0, len(text_items)):
-            this_text = text_items[index]
-            this_class = class_designations[index]
-            self._train_class(this_text, this_class)
         self._trained = True
         self.update_counts()
 
+    def _check_class_labels(self, class_designations):
+        for class_label in set(class_designations):
+            if class_label not in self._classes:
+                raise f'Unknown class label found: {class_label}'
+
+    def _train_text_chunks_parallel(self, chunks, workers):
+        # every worker cleans and counts only the rows it is sent, and keeps its own
+        # tables until the end so only one set of tables per worker comes back
+        context = _get_worker_context()
+        chunk_queue = context.Queue(maxsize=workers * 2)
+        result_queue = context.Queue()
+        processes = []
+        for worker_index in range(workers):
+            class_counts = {this_class: {nval: Counter() for nval in range(self._min, self._max)}
+                            for this_class in self._classes.keys()}
+            process = context.Process(target=_count_rows_worker,
+                                      args=(worker_index, class_counts,
+                                            chunk_queue, result_queue),
+                                      daemon=True)
+            process.start()
+            processes.append(process)
+
+        try:
+            for text_items, class_designations in chunks:
+                self._check_class_labels(class_designations)
+                text_items = list(text_items)
+                class_designations = list(class_designations)
+                slice_size = max(1, -(-len(text_items) // workers))
+                for start in range(0, len(text_items), slice_size):
+                    self._put_chunk(processes, chunk_queue,
+                                    (text_items[start:start + slice_size],
+                                     class_designations[start:start + slice_size]),
+                                    result_queue)
+            for _ in processes:
+                self._put_chunk(processes, chunk_queue, None, result_queue)
+            worker_counts = {}
+            for _ in processes:
+                result = result_queue.get()
+                if isinstance(result, Exception):
+                    raise result
+                worker_index, class_counts = result
+                worker_counts[worker_index] = class_counts
+            # merged in a fixed order rather than in the order the workers finish
+            for worker_index in sorted(worker_counts):
+                self._merge_counts(worker_counts.pop(worker_index))
+        finally:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+                process.join()
+
+    def _put_chunk(self, processes, chunk_queue, chunk, result_queue):
+        while True:
+            try:
+                chunk_queue.put(chunk, timeout=1)
+                return
+            except queue.Full:
+                if not all(process.is_alive() for process in processes):
+                    try:
+                        result = result_queue.get(timeout=1)
+                    except queue.Empty:
+                        result = None
+                    if isinstance(result, Exception):
+                        raise result
+                    raise RuntimeError("ngram training worker stopped")
+
+    def _merge_counts(self, class_counts):
+        for this_class, nval_counts in class_counts.items():
+            for nval, ngram_counts in nval_counts.items():
+                record = self._classes[this_class][nval]
+                if record.ngrams:
+                    record.ngrams.update(ngram_counts)
+                else:
+                    record.ngrams = ngram_counts
+
+    # ----------------------------------------------------------------
+    # ----------------------------------------------------------------
+    # ----------------------------------------------------------------
+
+    def compile(self):
+        """Freezes the trained counts into a read-only NGramCompiledModel
+
+        Called lazily by classify_text, and invalidated whenever the counts change
+        """
+        assert(self._trained), "model must be trained before compiling"
+        if self._read_only:
+            return self._compiled
+        self._compiled = NGramCompiledModel.from_records(
+            self._classes, self._min, self._max)
+        return self._compiled
+
     # ----------------------------------------------------------------
     # ----------------------------------------------------------------
     # ----------------------------------------------------------------
 
     def update_counts(self):
         """ Manual call to update the total counts for each class """
+        assert(not self._read_only), "compiled models are read-only"
+        # the pool workers hold a copy of the previous counts
+        self.close_pool()
+        self._compiled = None
+        self._cache.clear()
         for this_class in self._classes.keys():
             for nval in range(self._min, self._max):
                 self._classes[this_class][nval].update_total()
@@ -188,10 +463,17 @@ class NGramClassifier():
     # ----------------------------------------------------------------
     # ----------------------------------------------------------------
 
+    @staticmethod
+    def _get_ngrams_to_save(ngram_counts, max_to_save):
+        # ties are broken by the ngram, so the ngrams kept don't depend on the order
+        # they were counted in (e.g. by several training workers)
+        return dict(sorted(ngram_counts.items(), key=lambda item: (-item[1], item[0]))[:max_to_save])
+
     def serialize(self, output_path, max_to_save):
         """Saves the classifier data to a file
         writes out the min/max ngrams, the class list, and the class data/counts for each
         """
+        assert(not self._read_only), "compiled models are read-only"
         with open(output_path, 'wb') as output_file:
             pickle.dump(self._min, output_file)
             pickle.dump(self._max, output_file)
@@ -199,15 +481,46 @@ class NGramClassifier():
             pickle.dump(key_list, output_file)
             for this_key in key_list:
                 for nval in range(self._min, self._max):
-                    pickle.dump(
-                        dict(self._classes[this_key][nval].ngrams.most_common(max_to_save)), output_file)
+                    pickle.dump(self._get_ngrams_to_save(
+                        self._classes[this_key][nval].ngrams, max_to_save), output_file)
+
+    def serialize_compiled(self, output_path, max_to_save=None):
+        """Saves the classifier as a binary compiled model (see NGramCompiledModel.save)
+        keeps the same max_to_save most common ngrams per class that serialize would
+        """
+        assert(not self._read_only), "compiled models are read-only"
+        class_records = {}
+        for this_class in self._classes.keys():
+            class_records[this_class] = {}
+            for nval in range(self._min, self._max):
+                record = NGramClassifierRecord()
+                record.ngrams = Counter(self._get_ngrams_to_save(
+                    self._classes[this_class][nval].ngrams, max_to_save))
+                record.update_total()
+                class_records[this_class][nval] = record
+        NGramCompiledModel.from_records(
+            class_records, self._min, self._max).save(output_path)
 
     def load(self, input_path):
         """Loads classifier data from a file
         includes the min/max ngrams, the class list, and the class data/counts
+
+        binary compiled models are memory-mapped and can only be used for classifying
         """
+        self.close_pool()
         self._classes = {}
         self._trained = False
+        self._compiled = None
+        self._read_only = False
+        self._cache.clear()
+        if NGramCompiledModel.is_model_file(input_path):
+            self._compiled = NGramCompiledModel.open(input_path)
+            self._min = self._compiled.min_len
+            self._max = self._compiled.max_len
+            self._classes = dict.fromkeys(self._compiled.classes)
+            self._read_only = True
+            self._trained = True
+            return
         with open(input_path, 'rb') as input_file:
             self._min = pickle.load(input_file)
             self._max = pickle.load(input_file)
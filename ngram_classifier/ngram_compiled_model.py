@@ -0,0 +1,269 @@
+import json
+import math
+import mmap
+import struct
+from itertools import repeat
+import numpy as np
+
+MODEL_MAGIC = b"NGRAMCM\0"
+MODEL_VERSION = 1
+MODEL_ALIGNMENT = 64
+
+# magic, version, header length
+_MODEL_PREAMBLE = struct.Struct("<8sII")
+
+
+class NGramCompiledModel():
+    '''
+    read-only, array backed view of a trained NGramClassifier
+
+    for each ngram value, every ngram seen by any class is interned into a single
+    vocabulary (ngram -> row) and the per-class log probabilities are stored in a
+    dense (vocab_size + 1, num_classes) array. The last row holds the log probability
+    of an ngram that was never seen, so a lookup is one hash per ngram.
+
+    A compiled model can be saved to a versioned binary file (see save) and opened
+    again with open, which memory-maps the file: the vocabulary is then a sorted
+    array of ngrams searched with numpy instead of a python dictionary, so nothing
+    is materialized and processes opening the same file share its pages.
+    '''
+
+    def __init__(self, class_list, min_len, max_len):
+        self.classes = list(class_list)
+        self.min_len = min_len
+        self.max_len = max_len
+        self._vocab = {}
+        self._keys = {}
+        self._counts = {}
+        self._log_probs = {}
+        self._priors = {}
+        self._path = None
+        self._mmap = None
+
+    @staticmethod
+    def from_records(class_records, min_len, max_len):
+        '''
+        builds the compiled model from a dictionary of
+        { class_label: { nval: NGramClassifierRecord } }
+        '''
+        model = NGramCompiledModel(class_records.keys(), min_len, max_len)
+        for nval in range(min_len, max_len):
+            records = [class_records[this_class][nval]
+                       for this_class in model.classes]
+            class_counts = [record.total_count for record in records]
+            overall_count = sum(class_counts)
+
+            vocab = {}
+            for record in records:
+                for this_ngram in record.ngrams:
+                    if this_ngram not in vocab:
+                        vocab[this_ngram] = len(vocab)
+
+            counts = np.zeros((len(vocab), len(records)), dtype=np.int64)
+            for class_index, record in enumerate(records):
+                for this_ngram, this_count in record.ngrams.items():
+                    counts[vocab[this_ngram], class_index] = this_count
+
+            model._add_ngram_table(nval, vocab, counts,
+                                   class_counts, overall_count)
+        return model
+
+    def _add_ngram_table(self, nval, vocab, counts, class_counts, overall_count):
+        denominators = np.array(
+            [this_count + overall_count for this_count in class_counts], dtype=np.float64)
+        self._vocab[nval] = vocab
+        self._counts[nval] = counts
+        # the extra last row is the (zero count) unknown ngram
+        self._log_probs[nval] = np.log(
+            (np.vstack([counts, np.zeros((1, counts.shape[1]), dtype=np.int64)]) + 1) / denominators)
+        self._priors[nval] = np.array([math.log((this_count + 1) * (1 - this_count / overall_count) /
+                                                (this_count + overall_count))
+                                       for this_count in class_counts], dtype=np.float64)
+
+    # ----------------------------------------------------------------
+    # ----------------------------------------------------------------
+    # ----------------------------------------------------------------
+
+    def _get_sorted_table(self, nval):
+        '''
+        returns the (keys, counts, log_probs) arrays for an ngram value
+        with the vocabulary sorted, as stored in the binary format
+        '''
+        if nval in self._keys:
+            return self._keys[nval], self._counts[nval], self._log_probs[nval]
+        vocab = self._vocab[nval]
+        keys = np.array(list(vocab.keys()), dtype=f'<U{nval}')
+        order = np.argsort(keys, kind='stable')
+        log_probs = self._log_probs[nval]
+        return (keys[order],
+                self._counts[nval][order],
+                np.vstack([log_probs[:-1][order], log_probs[-1:]]))
+
+    def save(self, output_path):
+        """Saves the compiled model to a versioned binary file
+
+        layout: magic, version, header length, json header, then each array
+        aligned to MODEL_ALIGNMENT bytes at the offset listed in the header
+        """
+        arrays = []
+        tables = {}
+        for nval in range(self.min_len, self.max_len):
+            keys, counts, log_probs = self._get_sorted_table(nval)
+            table = {}
+            for name, array in (("keys", keys),
+                                ("counts", counts.astype('<i8')),
+                                ("log_probs", log_probs.astype('<f8')),
+                                ("priors", self._priors[nval].astype('<f8'))):
+                table[name] = {"dtype": array.dtype.str,
+                               "shape": list(array.shape)}
+                arrays.append((table[name], np.ascontiguousarray(array)))
+            tables[str(nval)] = table
+
+        header = {
+            "classes": self.classes,
+            "min_len": self.min_len,
+            "max_len": self.max_len,
+            "tables": tables
+        }
+
+        # offsets depend on the header length, so lay the data out after sizing the header
+        header_bytes = b""
+        while True:
+            offset = _MODEL_PREAMBLE.size + len(header_bytes)
+            for array_info, array in arrays:
+                offset = -(-offset // MODEL_ALIGNMENT) * MODEL_ALIGNMENT
+                array_info["offset"] = offset
+                offset += array.nbytes
+            new_header_bytes = json.dumps(header).encode("utf-8")
+            if len(new_header_bytes) == len(header_bytes):
+                break
+            header_bytes = new_header_bytes
+
+        with open(output_path, 'wb') as output_file:
+            output_file.write(_MODEL_PREAMBLE.pack(
+                MODEL_MAGIC, MODEL_VERSION, len(header_bytes)))
+            output_file.write(header_bytes)
+            for array_info, array in arrays:
+                output_file.write(
+                    b"\0" * (array_info["offset"] - output_file.tell()))
+                output_file.write(array.tobytes())
+
+    @staticmethod
+    def is_model_file(input_path):
+        with open(input_path, 'rb') as input_file:
+            return input_file.read(len(MODEL_MAGIC)) == MODEL_MAGIC
+
+    @staticmethod
+    def open(input_path):
+        """Opens a binary model file saved with save, memory-mapping its arrays"""
+        with open(input_path, 'rb') as input_file:
+            model_map = mmap.mmap(input_file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+
+        magic, version, header_length = _MODEL_PREAMBLE.unpack_from(model_map)
+        if magic != MODEL_MAGIC:
+            raise ValueError(f'{input_path} is not a compiled ngram model')
+        if version != MODEL_VERSION:
+            raise ValueError(
+                f'unsupported compiled ngram model version {version} in {input_path}')
+        header = json.loads(
+            model_map[_MODEL_PREAMBLE.size:_MODEL_PREAMBLE.size + header_length].decode("utf-8"))
+
+        model = NGramCompiledModel(
+            header["classes"], header["min_len"], header["max_len"])
+        model._path = input_path
+        model._mmap = model_map
+        for nval_str, table in header["tables"].items():
+            nval = int(nval_str)
+            arrays = {}
+            for name, array_info in table.items():
+                shape = array_info["shape"]
+                arrays[name] = np.frombuffer(model_map, dtype=np.dtype(array_info["dtype"]),
+                                             count=int(np.prod(shape)),
+                                             offset=array_info["offset"]).reshape(shape)
+            model._keys[nval] = arrays["keys"]
+            model._counts[nval] = arrays["counts"]
+            model._log_probs[nval] = arrays["log_probs"]
+            model._priors[nval] = arrays["priors"]
+        return model
+
+    def __getstate__(self):
+        # memory-mapped models are re-opened from their file instead of copying the arrays
+        if self._path:
+            return {"path": self._path}
+        return self.__dict__
+
+    def __setstate__(self, state):
+        if "path" in state:
+            self.__dict__ = NGramCompiledModel.open(state["path"]).__dict__
+        else:
+            self.__dict__ = state
+
+    # ----------------------------------------------------------------
+    # ----------------------------------------------------------------
+    # ----------------------------------------------------------------
+
+    def _get_ngrams(self, text, nval):
+        joined = "".join(text.split())
+        return [joined[i:i + nval] for i in range(len(joined) - nval + 1)]
+
+    def _lookup(self, nval, ngram_list):
+        if nval in self._vocab:
+            vocab = self._vocab[nval]
+            unknown = len(vocab)
+            return np.fromiter(map(vocab.get, ngram_list, repeat(unknown, len(ngram_list))),
+                               dtype=np.intp, count=len(ngram_list))
+
+        keys = self._keys[nval]
+        unknown = len(keys)
+        if unknown == 0 or len(ngram_list) == 0:
+            return np.full(len(ngram_list), unknown, dtype=np.intp)
+        queries = np.array(ngram_list, dtype=keys.dtype)
+        indexes = np.minimum(np.searchsorted(keys, queries), unknown - 1)
+        return np.where(keys[indexes] == queries, indexes, unknown)
+
+    def get_ratio_sums(self, cleaned_texts, scale_factors):
+        '''
+        scores a batch of cleaned texts at once
+
+        returns a (num_texts, num_classes) array holding, for each text, the sum of the
+        per-ngram-value class probabilities that produced a usable score
+        '''
+        ratio_sums = np.zeros((len(cleaned_texts), len(self.classes)), dtype=np.float64)
+        for nval in range(self.min_len, self.max_len):
+            ratio_sums += self.get_nval_ratios(cleaned_texts, scale_factors, nval)
+        return ratio_sums
+
+    def get_nval_ratios(self, cleaned_texts, scale_factors, nval):
+        '''
+        returns the (num_texts, num_classes) class probabilities of a batch of cleaned
+        texts for a single ngram value, with zero rows where there is no usable score
+        '''
+        num_texts = len(cleaned_texts)
+        num_classes = len(self.classes)
+        ratios = np.zeros((num_texts, num_classes), dtype=np.float64)
+        lengths = np.fromiter(map(len, cleaned_texts),
+                              dtype=np.intp, count=num_texts)
+        rows = np.flatnonzero(lengths >= nval)
+        if len(rows) == 0:
+            return ratios
+
+        ngram_list = []
+        ngram_counts = np.zeros(len(rows), dtype=np.intp)
+        for position, row in enumerate(rows):
+            row_ngrams = self._get_ngrams(cleaned_texts[row], nval)
+            ngram_counts[position] = len(row_ngrams)
+            ngram_list.extend(row_ngrams)
+
+        log_probs = self._log_probs[nval][self._lookup(nval, ngram_list)]
+        positions = np.repeat(np.arange(len(rows)), ngram_counts)
+        p = np.empty((len(rows), num_classes), dtype=np.float64)
+        for class_index in range(num_classes):
+            p[:, class_index] = np.bincount(positions, weights=log_probs[:, class_index],
+                                            minlength=len(rows))
+        p = np.exp((p + self._priors[nval]) *
+                   scale_factors[rows, np.newaxis])
+        d = p.sum(axis=1)
+        usable = d != 0.0
+        ratios[rows[usable]] = p[usable] / d[usable, np.newaxis]
+        return ratios
@@ -0,0 +1,2 @@
+from .numpy_nnet import NumpyNNet
+from .features import CLASS_WEIGHTS, FEATURE_NAMES, get_class_prob_matrix, get_weighted_feature_matrix, get_input_matrix, get_training_outputs
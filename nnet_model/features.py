@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+from utils import get_metrics
+
+CLASS_WEIGHTS = [
+    ("num_days", 0.997821848),
+    ("statuses_per_day", 1.065570851),
+    ("followers_per_day", 1.021055002),
+    ("following_per_day", 1.122703153),
+    ("desc_len_terms", 1.171072307),
+    ("num_list_items", 1.017727903),
+    ("num_hashtags", 0.889418197),
+    ("url_count", 1.018365516)
+]
+
+FEATURE_NAMES = ["p_good", "p_bot"] + [label for label, weight in CLASS_WEIGHTS]
+
+DESCRIPTION_COLUMN = "user_profile_description"
+
+
+def get_class_prob_matrix(df, classifier, workers=1):
+    '''
+    scores the user bios with the n-gram classifier in one batch, returning a
+    (num_rows, 2) array of the p_good, p_bot probabilities
+    '''
+    class_indexes = [classifier.get_classes().index(class_label)
+                     for class_label in ("good", "bot")]
+    class_probs = classifier.classify_text_matrix(
+        df[DESCRIPTION_COLUMN].astype(str).tolist(), workers=workers)
+    return np.asarray(class_probs)[:, class_indexes]
+
+
+def get_weighted_feature_matrix(df):
+    '''
+    returns the (num_rows, len(CLASS_WEIGHTS)) array of the user data features, each
+    scaled by its weight. Missing columns and values that aren't numbers count as 0
+    '''
+    features = np.zeros((len(df.index), len(CLASS_WEIGHTS)), dtype=np.float64)
+    for column_index, (label, weight) in enumerate(CLASS_WEIGHTS):
+        if label in df.columns:
+            features[:, column_index] = pd.to_numeric(
+                df[label], errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+    features *= np.array([weight for label, weight in CLASS_WEIGHTS])
+    return features
+
+
+def get_input_matrix(df, classifier, workers=1):
+    '''
+    builds the network input for every row of a frame of user data:
+
+    (classifier): p_good
+    (classifier): p_bot
+    num_days
+    statuses_per_day
+    followers_per_day
+    following_per_day
+    desc_len_terms
+    num_list_items
+    num_hashtags
+    url_count
+    '''
+    class_probs = get_class_prob_matrix(df, classifier, workers)
+    with get_metrics().timer("feature_assembly"):
+        return np.hstack([class_probs, get_weighted_feature_matrix(df)])
+
+
+def get_training_outputs(df):
+    return (df["class_value"].astype(str) != "good").to_numpy(dtype=np.float64)
@@ -0,0 +1,99 @@
+import zipfile
+import numpy as np
+
+NNET_FORMAT = "numpy_nnet"
+NNET_VERSION = 1
+
+
+def _relu(x):
+    return np.maximum(x, 0)
+
+
+def _sigmoid(x):
+    # 1 / (1 + exp(-x)) without overflowing for large negative x
+    return np.exp(-np.logaddexp(0, -x))
+
+
+def _linear(x):
+    return x
+
+
+ACTIVATIONS = {
+    "relu": _relu,
+    "sigmoid": _sigmoid,
+    "tanh": np.tanh,
+    "linear": _linear
+}
+
+
+class NumpyNNet():
+    '''
+    inference-only copy of a trained Keras Sequential model of Dense layers: each
+    layer is a matrix multiply, a bias add and an activation, so scoring doesn't
+    need Keras or TensorFlow. predict returns the same (num_rows, num_outputs)
+    array as the Keras model's predict
+    '''
+
+    def __init__(self, weights, biases, activations):
+        self._weights = weights
+        self._biases = biases
+        self._activations = activations
+        for activation in activations:
+            if activation not in ACTIVATIONS:
+                raise ValueError(f'unsupported activation: {activation}')
+
+    @staticmethod
+    def from_keras(keras_model):
+        weights = []
+        biases = []
+        activations = []
+        for layer in keras_model.layers:
+            layer_config = layer.get_config()
+            if layer.__class__.__name__ != "Dense" or not layer_config.get("use_bias", True):
+                raise ValueError(
+                    f'unsupported layer: {layer.name} (only Dense layers with a bias are)')
+            kernel, bias = layer.get_weights()
+            weights.append(kernel)
+            biases.append(bias)
+            activations.append(layer_config["activation"])
+        return NumpyNNet(weights, biases, activations)
+
+    def save(self, output_path):
+        arrays = {
+            "format": np.array(NNET_FORMAT),
+            "version": np.array(NNET_VERSION),
+            "activations": np.array(self._activations)
+        }
+        for layer_index, (kernel, bias) in enumerate(zip(self._weights, self._biases)):
+            arrays[f'weights_{layer_index}'] = kernel
+            arrays[f'bias_{layer_index}'] = bias
+        # write through a file object so numpy doesn't append .npz to the path
+        with open(output_path, 'wb') as output_file:
+            np.savez(output_file, **arrays)
+
+    @staticmethod
+    def is_model_file(input_path):
+        return zipfile.is_zipfile(input_path)
+
+    @staticmethod
+    def load(input_path):
+        with np.load(input_path, allow_pickle=False) as arrays:
+            if "format" not in arrays or str(arrays["format"]) != NNET_FORMAT:
+                raise ValueError(f'{input_path} is not a numpy nnet model')
+            if int(arrays["version"]) != NNET_VERSION:
+                raise ValueError(
+                    f'unsupported numpy nnet model version {int(arrays["version"])} in {input_path}')
+            activations = [str(activation)
+                           for activation in arrays["activations"]]
+            weights = [arrays[f'weights_{layer_index}']
+                       for layer_index in range(len(activations))]
+            biases = [arrays[f'bias_{layer_index}']
+                      for layer_index in range(len(activations))]
+        return NumpyNNet(weights, biases, activations)
+
+    def predict(self, x, **kwargs):
+        # evaluated in the weights' precision (float32 from Keras), as Keras does
+        values = np.asarray(x, dtype=self._weights[0].dtype)
+        for kernel, bias, activation in zip(self._weights, self._biases, self._activations):
+            values = ACTIVATIONS[activation](values @ kernel + bias)
+        return values
@@ -10,11 +10,9 @@ SET TwitterCredentials=".\twitter_auth.json"
 SET NNModel=".\resources\model-is_good_or_bad_nnet.dat"
 SET NGramModel=".\resources\model-is_good_or_bad_user_desc_ngram_class.dat"
 SET FullInputPath="%DataPath%\%InputFilenameNoExt%.csv"
-SET ExtractOutputPath="%DataPath%\%InputFilenameNoExt%_userdat.csv"
 SET FinalOutputPath="%DataPath%\%InputFilenameNoExt%_scored.csv"
 
-python extract_users_from_csvs.py -i %FullInputPath% -o %ExtractOutputPath% -c %TwitterCredentials%
-python run_nnet.py -i %ExtractOutputPath% -o %FinalOutputPath% -n %NNModel% -m %NGramModel%
+python trust_defender.py -i %FullInputPath% -c %TwitterCredentials% -o %FinalOutputPath% -n %NNModel% -m %NGramModel%
 
 GOTO EndScript
 
@@ -35,9 +35,6 @@ TwitterCredentials="./twitter_auth.json"
 NNModel="./resources/model-is_good_or_bad_nnet.dat"
 NGramModel="./resources/model-is_good_or_bad_user_desc_ngram_class.dat"
 FullInputPath="$DataPath/$InputFilenameNoExt.csv"
-ExtractOutputPath="$DataPath/$InputFilenameNoExt.userdat.csv"
 FinalOutputPath="$DataPath/$InputFilenameNoExt.scored.csv"
 
-python extract_users_from_dt.py -i $DTCredentials -a $ArchiveId -o $FullInputPath
-python extract_users_from_csvs.py -i $FullInputPath -o $ExtractOutputPath -c $TwitterCredentials
-python run_nnet.py -i $ExtractOutputPath -o $FinalOutputPath -n $NNModel -m $NGramModel
+python trust_defender.py -d $DTCredentials -a $ArchiveId -c $TwitterCredentials -o $FinalOutputPath -n $NNModel -m $NGramModel --names-output $FullInputPath
@@ -0,0 +1,283 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timezone
+from timeit import default_timer as timer
+import numpy
+import pandas as pd
+from ngram_classifier import NGramClassifier
+from utils import clean_text, get_ngrams, get_bio_feature_frame
+
+TEXT_COLUMN = "user_profile_description"
+CLASS_COLUMN = "class_value"
+
+DEFAULT_CORPUS = "./resources/test.csv"
+DEFAULT_NNET_MODEL = "./resources/model-is_good_or_bad_nnet.dat"
+
+
+class BenchmarkContext():
+    '''
+    the corpus being benchmarked and what the benchmarks share: the trained
+    classifier and its saved models are built once, outside of the timings
+    '''
+
+    def __init__(self, corpus_path, num_rows, work_dir, nnet_model_path,
+                 ngram_min=5, ngram_max=9, workers=1):
+        self.corpus_path = corpus_path
+        self.df = pd.read_csv(corpus_path, keep_default_na=False,
+                              nrows=num_rows, low_memory=False)
+        self.df = self.df[(self.df[TEXT_COLUMN].astype(str).str.len() > 0) &
+                          (self.df[CLASS_COLUMN].astype(str).str.len() > 0)]
+        self.texts = self.df[TEXT_COLUMN].astype(str).tolist()
+        self.classes = self.df[CLASS_COLUMN].astype(str).tolist()
+        self.class_list = sorted(set(self.classes))
+        self.work_dir = work_dir
+        self.nnet_model_path = nnet_model_path
+        self.ngram_min = ngram_min
+        self.ngram_max = ngram_max
+        self.workers = workers
+        self._cleaned_texts = None
+        self._classifier = None
+        self._model_paths = {}
+
+    def get_cleaned_texts(self):
+        if self._cleaned_texts is None:
+            self._cleaned_texts = [clean_text(t) for t in self.texts]
+        return self._cleaned_texts
+
+    def new_classifier(self):
+        return NGramClassifier(classes=self.class_list,
+                               min_len=self.ngram_min, max_len=self.ngram_max)
+
+    def get_classifier(self):
+        if self._classifier is None:
+            self._classifier = self.new_classifier()
+            self._classifier.train_text(
+                self.texts, self.classes, workers=self.workers)
+            self._classifier.compile()
+            if self.workers > 1:
+                self._classifier.start_pool(self.workers)
+        return self._classifier
+
+    def close(self):
+        if self._classifier is not None:
+            self._classifier.close_pool()
+
+    def get_model_path(self, binary):
+        if binary not in self._model_paths:
+            model_path = os.path.join(
+                self.work_dir, "ngram_model.bin" if binary else "ngram_model.dat")
+            if binary:
+                self.get_classifier().serialize_compiled(model_path, max_to_save=100000)
+            else:
+                self.get_classifier().serialize(model_path, max_to_save=100000)
+            self._model_paths[binary] = model_path
+        return self._model_paths[binary]
+
+
+# each benchmark returns (number of items processed, function to time, setup run before each timing)
+
+def bench_clean_text(context):
+    texts = context.texts
+    return len(texts), lambda: [clean_text(t) for t in texts], None
+
+
+def bench_get_ngrams(context):
+    cleaned_texts = context.get_cleaned_texts()
+    nvals = range(context.ngram_min, context.ngram_max)
+
+    def run():
+        for this_text in cleaned_texts:
+            for nval in nvals:
+                get_ngrams(this_text, nval)
+    return len(cleaned_texts), run, None
+
+
+def bench_ngram_train(context):
+    return len(context.texts), lambda: context.new_classifier().train_text(
+        context.texts, context.classes, workers=context.workers), None
+
+
+def bench_ngram_classify_text(context):
+    classifier = context.get_classifier()
+    texts = context.texts
+    return len(texts), lambda: [classifier.classify_text(t) for t in texts], classifier.clear_cache
+
+
+def bench_ngram_classify_batch(context):
+    classifier = context.get_classifier()
+    return len(context.texts), lambda: classifier.classify_text_matrix(
+        context.texts, workers=context.workers), classifier.clear_cache
+
+
+def bench_ngram_load(context):
+    model_path = context.get_model_path(binary=False)
+    return 1, lambda: NGramClassifier(model_path=model_path), None
+
+
+def bench_ngram_load_binary(context):
+    model_path = context.get_model_path(binary=True)
+    return 1, lambda: NGramClassifier(model_path=model_path), None
+
+
+def bench_get_user_add_props(context):
+    # extract_users_from_csvs needs nltk's punkt data and tweepy
+    from extract_users_from_csvs import get_user_add_props
+    texts = context.texts
+    return len(texts), lambda: [get_user_add_props(t) for t in texts], None
+
+
+def bench_bio_features(context):
+    return len(context.texts), lambda: get_bio_feature_frame(
+        context.texts, context.workers), None
+
+
+def bench_run_nnet(context):
+    '''
+    what run_nnet.py does: load both models, read the input, score it and write the output
+    '''
+    from run_nnet import load_nnet, score_frame
+    model_path = context.get_model_path(binary=True)
+    output_path = os.path.join(context.work_dir, "scored.csv")
+
+    def run():
+        classifier = NGramClassifier(model_path=model_path)
+        nnet = load_nnet(context.nnet_model_path)
+        df_test = pd.read_csv(context.corpus_path, keep_default_na=False,
+                              nrows=len(context.df.index), low_memory=False)
+        if "verified" not in df_test.columns:
+            df_test["verified"] = False
+        score_frame(df_test, classifier, nnet,
+                    context.workers).to_csv(output_path)
+        classifier.close_pool()
+    return len(context.df.index), run, None
+
+
+BENCHMARKS = {
+    "clean_text": bench_clean_text,
+    "get_ngrams": bench_get_ngrams,
+    "ngram_train": bench_ngram_train,
+    "ngram_classify_text": bench_ngram_classify_text,
+    "ngram_classify_batch": bench_ngram_classify_batch,
+    "ngram_load": bench_ngram_load,
+    "ngram_load_binary": bench_ngram_load_binary,
+    "get_user_add_props": bench_get_user_add_props,
+    "bio_features": bench_bio_features,
+    "run_nnet": bench_run_nnet
+}
+
+
+def run_benchmark(name, context, repeats):
+    num_items, run, setup = BENCHMARKS[name](context)
+    # an untimed run first, so the timings don't include building the lazy
+    # state (cleaned texts, trained classifier, saved models, worker pools)
+    if setup:
+        setup()
+    run()
+    times = []
+    for _ in range(repeats):
+        if setup:
+            setup()
+        start = timer()
+        run()
+        times.append(timer() - start)
+    best = min(times)
+    return {
+        "name": name,
+        "items": num_items,
+        "repeats": repeats,
+        "times": times,
+        "min": best,
+        "median": statistics.median(times),
+        "items_per_second": num_items / best if best > 0 else None
+    }
+
+
+def get_git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def get_environment():
+    return {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "numpy": numpy.__version__,
+        "pandas": pd.__version__,
+        "git_commit": get_git_commit()
+    }
+
+
+def print_comparison(results, baseline_path):
+    with open(baseline_path, 'r') as baseline_file:
+        baseline = {this_result["name"]: this_result
+                    for this_result in json.load(baseline_file)["benchmarks"]}
+    print('---- compared to baseline (median time) ----')
+    for this_result in results["benchmarks"]:
+        baseline_result = baseline.get(this_result["name"])
+        if not baseline_result:
+            print(f'{this_result["name"]}: not in baseline')
+            continue
+        ratio = this_result["median"] / baseline_result["median"]
+        print(f'{this_result["name"]}: {baseline_result["median"]:.4f}s -> {this_result["median"]:.4f}s ({ratio:.2f}x)')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--input", default=DEFAULT_CORPUS,
+                        help="corpus csv file (see generate_synthetic_corpus.py)")
+    parser.add_argument("-n", "--rows", type=int,
+                        help="only benchmark the first rows of the corpus")
+    parser.add_argument("-b", "--benchmarks", default=",".join(BENCHMARKS),
+                        help="comma separated benchmarks to run")
+    parser.add_argument("-r", "--repeats", type=int, default=3,
+                        help="number of timings of each benchmark")
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                        help="number of processes used by the benchmarks that can use them")
+    parser.add_argument("-m", "--nnetmodel", default=DEFAULT_NNET_MODEL,
+                        help="NNet model file used by the run_nnet benchmark")
+    parser.add_argument("-o", "--output", help="output json file")
+    parser.add_argument("-c", "--compare",
+                        help="json output of an earlier run to compare with")
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.benchmarks.split(",") if name.strip()]
+    for name in names:
+        if name not in BENCHMARKS:
+            raise f'unknown benchmark {name}, expected one of: {", ".join(BENCHMARKS)}'
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        context = BenchmarkContext(args.input, args.rows, work_dir,
+                                   args.nnetmodel, workers=args.workers)
+        print(f'benchmarking {len(context.texts)} rows of {args.input}')
+        results = {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "environment": get_environment(),
+            "corpus": {"path": args.input, "rows": len(context.texts)},
+            "workers": args.workers,
+            "benchmarks": []
+        }
+        try:
+            for name in names:
+                this_result = run_benchmark(name, context, args.repeats)
+                results["benchmarks"].append(this_result)
+                print(f'{name}: median {this_result["median"]:.4f}s, min {this_result["min"]:.4f}s, '
+                      f'{this_result["items_per_second"] or 0:.1f} items/s')
+        finally:
+            context.close()
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+    if args.compare:
+        print_comparison(results, args.compare)
@@ -1,80 +1,57 @@
 import argparse
 import numpy
 import pandas as pd
-from keras import backend as K
-from keras.models import Sequential
-from keras.layers import Dense
-from keras.models import model_from_json
 from ngram_classifier import NGramClassifier
-from sklearn.metrics import precision_recall_fscore_support
+from nnet_model import NumpyNNet, get_input_matrix
+from utils import get_metrics, add_metrics_arguments, start_metrics, finish_metrics
 
 THRESHOLD = 0.80
 
-CLASS_WEIGHTS = [
-    ("num_days", 0.997821848),
-    ("statuses_per_day", 1.065570851),
-    ("followers_per_day", 1.021055002),
-    ("following_per_day", 1.122703153),
-    ("desc_len_terms", 1.171072307),
-    ("num_list_items", 1.017727903),
-    ("num_hashtags", 0.889418197),
-    ("url_count", 1.018365516)
-]
+
+def is_bot_value(is_verified, value):
+    if is_verified:
+        return "good"
+    return "bot" if value > THRESHOLD else "good"
 
 
-def get_input_vector(row, classifier):
+def load_nnet(nnet_model_path):
     '''
-    (classifier): p_good
-    (classifier): p_bot
-    num_days
-    statuses_per_day
-    followers_per_day
-    following_per_day
-    desc_len_terms
-    num_list_items
-    num_hashtags
-    url_count
+    loads either a numpy nnet model (see export_nnet.py), which needs neither Keras
+    nor TensorFlow, or the Keras model json and its weights (saved alongside as
+    {nnet_model_path}.h5)
     '''
-    class_probs = classifier.classify_text(
-        str(row["user_profile_description"]))
-    ret = [class_probs["good"], class_probs["bot"]]
-    for label, weight in CLASS_WEIGHTS:
-        try:
-            ret.append(float(row[label]) * weight)
-        except:
-            ret.append(0.0)
-    return ret
-
-
-def get_training_output(row):
-    class_label = str(row["class_value"])
-    return 0.0 if class_label == "good" else 1.0
-
-
-def recall_m(y_true, y_pred):
-    true_positives = K.sum(K.round(K.clip(y_true * y_pred, 0, 1)))
-    possible_positives = K.sum(K.round(K.clip(y_true, 0, 1)))
-    recall = true_positives / (possible_positives + K.epsilon())
-    return recall
+    if NumpyNNet.is_model_file(nnet_model_path):
+        return NumpyNNet.load(nnet_model_path)
 
-
-def precision_m(y_true, y_pred):
-    true_positives = K.sum(K.round(K.clip(y_true * y_pred, 0, 1)))
-    predicted_positives = K.sum(K.round(K.clip(y_pred, 0, 1)))
-    precision = true_positives / (predicted_positives + K.epsilon())
-    return precision
-
-
-def f1_m(y_true, y_pred):
-    precision = precision_m(y_true, y_pred)
-    recall = recall_m(y_true, y_pred)
-    return 2*((precision*recall)/(precision+recall+K.epsilon()))
+    # only imported for Keras models: importing TensorFlow takes several seconds
+    from keras.models import model_from_json
+    from nnet_model.keras_metrics import f1_m, precision_m, recall_m
+    with open(nnet_model_path, 'r') as json_file:
+        loaded_model_json = json_file.read()
+        nnet = model_from_json(loaded_model_json)
+    nnet.load_weights(f'{nnet_model_path}.h5')
+    nnet.compile(loss='binary_crossentropy', optimizer='adam',
+                 metrics=['acc', f1_m, precision_m, recall_m])
+    return nnet
 
 
-def is_bot_value(is_verified, value):
-    if is_verified:
-        return "good"
-    return "bot" if value > THRESHOLD else "good"
+def score_frame(df_test, classifier, nnet, workers=1):
+    '''
+    scores a frame of user data, dropping verified users and
+    adding the is_bot_belief / is_bot columns
+    '''
+    df_test = df_test.drop(df_test[df_test.verified == True].index)
+    if len(df_test.index) == 0:
+        df_test["is_bot_belief"] = []
+        df_test["is_bot"] = []
+        return df_test
+    input_matrix = get_input_matrix(df_test, classifier, workers)
+    with get_metrics().timer("predict"):
+        predictions = nnet.predict(input_matrix)
+    df_test["is_bot_belief"] = predictions
+    df_test["is_bot"] = numpy.where((df_test["verified"] != True) & (predictions.ravel() > THRESHOLD),
+                                    "bot", "good")
+    return df_test
 
 
 if __name__ == "__main__":
@@ -83,6 +60,11 @@ if __name__ == "__main__":
     parser.add_argument("-m", "--model", help="ngram model file")
     parser.add_argument("-n", "--nnetmodel", help="NNet model file")
     parser.add_argument("-o", "--output", help="output csv file")
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                        help="number of processes used to score the input")
+    parser.add_argument("-c", "--chunksize", type=int,
+                        help="stream the input in chunks of this many rows")
+    add_metrics_arguments(parser)
     args = parser.parse_args()
 
     if not args.input:
@@ -94,32 +76,40 @@ if __name__ == "__main__":
     if not args.output:
         raise "missing output file"
 
-    classifier = NGramClassifier(model_path=args.model)
-
-    with open(args.nnetmodel, 'r') as json_file:
-        loaded_model_json = json_file.read()
-        nnet = model_from_json(loaded_model_json)
-    nnet.load_weights(f'{args.nnetmodel}.h5')
-    nnet.compile(loss='binary_crossentropy', optimizer='adam',
-                 metrics=['acc', f1_m, precision_m, recall_m])
-
-    df_test = pd.read_csv(args.input, keep_default_na=False)
-
-    df_test = df_test.drop(df_test[df_test.verified == True].index)
-    indexes = []
-    targets_x = []
-    predictions = []
-    for index, row in df_test.iterrows():
-        try:
-            input_vector = get_input_vector(row, classifier)
-        except:
-            print(f'(error parsing row {index}... skipping...)')
-            continue
-        indexes.append(index)
-        targets_x.append(input_vector)
-    predictions = nnet.predict(numpy.array(targets_x))
-    df_test["is_bot_belief"] = predictions
-    df_test["is_bot"] = df_test.apply(lambda row: is_bot_value(
-        row["verified"], row["is_bot_belief"]), axis=1)
-
-    df_test.to_csv(args.output)
+    start_metrics(args)
+    metrics = get_metrics()
+
+    with metrics.timer("load_models"):
+        classifier = NGramClassifier(model_path=args.model)
+        if args.workers > 1:
+            # one pool scores every chunk, started before TensorFlow starts its threads
+            classifier.start_pool(args.workers)
+        nnet = load_nnet(args.nnetmodel)
+
+    if args.chunksize:
+        # stream the input so memory stays flat regardless of the input size
+        rows_scored = 0
+        df_chunks = pd.read_csv(args.input, keep_default_na=False,
+                                chunksize=args.chunksize)
+        for chunk_index, df_chunk in enumerate(metrics.timed_iter("read_csv", df_chunks)):
+            metrics.count("rows_read", len(df_chunk.index))
+            df_chunk = score_frame(df_chunk, classifier, nnet, args.workers)
+            with metrics.timer("write_csv"):
+                df_chunk.to_csv(args.output, mode='w' if chunk_index == 0 else 'a',
+                                header=chunk_index == 0)
+            rows_scored += len(df_chunk.index)
+            metrics.count("rows_scored", len(df_chunk.index))
+            print(f'... scored {rows_scored} rows')
+    else:
+        with metrics.timer("read_csv"):
+            df_test = pd.read_csv(args.input, keep_default_na=False)
+        metrics.count("rows_read", len(df_test.index))
+        df_test = score_frame(df_test, classifier, nnet, args.workers)
+        metrics.count("rows_scored", len(df_test.index))
+        with metrics.timer("write_csv"):
+            df_test.to_csv(args.output)
+
+    classifier.close_pool()
+    metrics.count_file_bytes("input_bytes", args.input)
+    metrics.count_file_bytes("output_bytes", args.output)
+    finish_metrics(args)
@@ -0,0 +1,47 @@
+import argparse
+import pandas as pd
+import requests
+
+DEFAULT_SERVICE_URL = "http://127.0.0.1:8085"
+
+
+def request_scores(session, service_url, df_users):
+    '''
+    scores a frame of user data with a running scoring_service.py, returning the frame
+    with the is_bot_belief / is_bot columns and the verified users dropped, like run_nnet.py
+    '''
+    response = session.post(f'{service_url}/score',
+                            json={"users": df_users.to_dict(orient="records")})
+    response.raise_for_status()
+    scores = response.json()["scores"]
+    df_users = df_users.copy()
+    df_users["is_bot_belief"] = [this_score["is_bot_belief"]
+                                 for this_score in scores]
+    df_users["is_bot"] = [this_score["is_bot"] for this_score in scores]
+    return df_users[df_users["is_bot_belief"].notna()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--input", help="test input csv file")
+    parser.add_argument("-o", "--output", help="output csv file")
+    parser.add_argument("-u", "--url", default=DEFAULT_SERVICE_URL,
+                        help="scoring service url")
+    parser.add_argument("-c", "--chunksize", type=int, default=1000,
+                        help="number of rows sent per request")
+    args = parser.parse_args()
+
+    if not args.input:
+        raise "missing input file"
+    if not args.output:
+        raise "missing output file"
+
+    with requests.Session() as session:
+        rows_scored = 0
+        for chunk_index, df_chunk in enumerate(pd.read_csv(args.input, keep_default_na=False,
+                                                           chunksize=args.chunksize)):
+            df_chunk = request_scores(session, args.url, df_chunk)
+            df_chunk.to_csv(args.output, mode='w' if chunk_index == 0 else 'a',
+                            header=chunk_index == 0)
+            rows_scored += len(df_chunk.index)
+            print(f'... scored {rows_scored} rows')
@@ -0,0 +1,241 @@
+import argparse
+import json
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pandas as pd
+from ngram_classifier import NGramClassifier
+from run_nnet import load_nnet, score_frame
+
+# the fields every user record needs, the other features count as 0 when missing
+REQUIRED_FIELDS = ["user_profile_description"]
+
+
+class ScoreRequest():
+    def __init__(self, records):
+        self.records = records
+        self.scores = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class ScoringService():
+    '''
+    keeps the n-gram classifier and the network loaded and scores batches of user
+    records (as written by extract_users_from_csvs.py) for any number of callers.
+
+    requests that arrive together are micro-batched: a single scoring thread waits up
+    to max_wait seconds (or until max_batch_size records are queued) and scores all
+    of them with one classify_text_list / predict call
+    '''
+
+    def __init__(self, classifier, nnet, max_batch_size=1024, max_wait=0.01, workers=1):
+        self._classifier = classifier
+        self._nnet = nnet
+        self._max_batch_size = max_batch_size
+        self._max_wait = max_wait
+        self._workers = workers
+        self._requests = queue.Queue()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.batches_scored = 0
+        self.records_scored = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+
+    def score(self, records):
+        '''
+        scores a list of user record dictionaries, returning a list of
+        { "is_bot_belief": float or None, "is_bot": "good" or "bot" } in the same order.
+        Verified users are not scored (belief None, always "good")
+        '''
+        if not records:
+            return []
+        request = ScoreRequest(records)
+        self._requests.put(request)
+        request.done.wait()
+        if request.error:
+            raise request.error
+        return request.scores
+
+    def _get_batch(self):
+        try:
+            batch = [self._requests.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        batch_size = len(batch[0].records)
+        deadline = time.monotonic() + self._max_wait
+        while batch_size < self._max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            batch_size += len(request.records)
+        return batch
+
+    def _score_batch(self, batch):
+        df_batch = pd.DataFrame([this_record for request in batch
+                                 for this_record in request.records])
+        if "verified" not in df_batch.columns:
+            df_batch["verified"] = False
+        df_scored = score_frame(df_batch, self._classifier,
+                                self._nnet, self._workers)
+        beliefs = df_scored["is_bot_belief"].to_dict()
+        labels = df_scored["is_bot"].to_dict()
+
+        start = 0
+        for request in batch:
+            request.scores = [{
+                "is_bot_belief": float(beliefs[index]) if index in beliefs else None,
+                "is_bot": labels.get(index, "good")
+            } for index in range(start, start + len(request.records))]
+            start += len(request.records)
+        self.batches_scored += 1
+        self.records_scored += start
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            batch = self._get_batch()
+            if not batch:
+                continue
+            try:
+                self._score_batch(batch)
+            except Exception as error:
+                for request in batch:
+                    request.error = error
+            for request in batch:
+                request.done.set()
+
+
+def get_records_error(records):
+    '''
+    returns why a request's "users" can't be scored, or None if they can
+    '''
+    if not isinstance(records, list):
+        return "\"users\" must be a list of user records"
+    for index, this_record in enumerate(records):
+        if not isinstance(this_record, dict):
+            return f"user {index} is not an object"
+        missing_fields = [field for field in REQUIRED_FIELDS if field not in this_record]
+        if missing_fields:
+            return f"user {index} is missing {', '.join(missing_fields)}"
+    return None
+
+
+class ScoringRequestHandler(BaseHTTPRequestHandler):
+    '''
+    POST /score with { "users": [ user records ] } returns { "scores": [...] }
+    GET /health returns the number of batches and records scored so far
+    '''
+
+    def _send_json(self, status, response_item):
+        response_body = json.dumps(response_item).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response_body)))
+        self.end_headers()
+        self.wfile.write(response_body)
+
+    def do_GET(self):
+        if self.path != "/health":
+            self._send_json(404, {"error": "not found"})
+            return
+        service = self.server.scoring_service
+        self._send_json(200, {
+            "status": "ok",
+            "batches_scored": service.batches_scored,
+            "records_scored": service.records_scored
+        })
+
+    def do_POST(self):
+        if self.path != "/score":
+            self._send_json(404, {"error": "not found"})
+            return
+        try:
+            content_length = int(self.headers.get("Content-Length", 0))
+            request_item = json.loads(self.rfile.read(content_length))
+            records = request_item["users"]
+        except (ValueError, KeyError, TypeError):
+            self._send_json(400, {"error": "expected a json body of {\"users\": [...]}"})
+            return
+        record_error = get_records_error(records)
+        if record_error:
+            self._send_json(400, {"error": record_error})
+            return
+        try:
+            scores = self.server.scoring_service.score(records)
+        except Exception as error:
+            self._send_json(500, {"error": str(error)})
+            return
+        self._send_json(200, {"scores": scores})
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def create_server(scoring_service, host="127.0.0.1", port=8085, verbose=False):
+    server = ThreadingHTTPServer((host, port), ScoringRequestHandler)
+    server.daemon_threads = True
+    server.scoring_service = scoring_service
+    server.verbose = verbose
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-m", "--model", help="ngram model file")
+    parser.add_argument("-n", "--nnetmodel", help="NNet model file")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="address to listen on")
+    parser.add_argument("-p", "--port", type=int, default=8085,
+                        help="port to listen on")
+    parser.add_argument("-b", "--batchsize", type=int, default=1024,
+                        help="maximum number of records scored in one batch")
+    parser.add_argument("--batchwait", type=float, default=10,
+                        help="milliseconds to wait for more requests to batch together")
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                        help="number of processes used to score a batch")
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="log every request")
+    args = parser.parse_args()
+
+    if not args.model:
+        raise "missing ngram model file"
+    if not args.nnetmodel:
+        raise "missing nnet model file"
+
+    classifier = NGramClassifier(model_path=args.model)
+    if args.workers > 1:
+        # the pool is forked once, before the model and the server start any threads
+        classifier.start_pool(args.workers)
+    nnet = load_nnet(args.nnetmodel)
+
+    scoring_service = ScoringService(classifier, nnet,
+                                     max_batch_size=args.batchsize,
+                                     max_wait=args.batchwait / 1000,
+                                     workers=args.workers)
+    scoring_service.start()
+    server = create_server(scoring_service, args.host,
+                           args.port, args.verbose)
+    print(f'scoring service listening on http://{args.host}:{args.port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        scoring_service.stop()
+        classifier.close_pool()
@@ -0,0 +1,67 @@
+import sys
+from datetime import datetime, timezone, timedelta
+import pandas as pd
+from utils import parse_created_at, get_num_days
+
+CREATED_AT = pd.Timestamp("2018-10-10 20:19:24", tz="UTC")
+
+
+def check_parse_created_at_datetimes():
+    # tweepy gives created_at as a datetime, naive (UTC) or timezone aware
+    dates = parse_created_at([datetime(2018, 10, 10, 20, 19, 24),
+                              datetime(2018, 10, 10, 20, 19, 24,
+                                       tzinfo=timezone.utc),
+                              datetime(2018, 10, 10, 22, 19, 24,
+                                       tzinfo=timezone(timedelta(hours=2))),
+                              pd.Timestamp("2018-10-10 20:19:24")])
+    assert dates.tolist() == [CREATED_AT] * 4, dates.tolist()
+
+
+def check_parse_created_at_strings():
+    dates = parse_created_at(["Wed Oct 10 20:19:24 +0000 2018",
+                              "2018-10-10T20:19:24Z",
+                              "2018-10-10 20:19:24"])
+    assert dates.tolist() == [CREATED_AT] * 3, dates.tolist()
+
+
+def check_parse_created_at_mixed():
+    dates = parse_created_at([datetime(2018, 10, 10, 20, 19, 24),
+                              "Wed Oct 10 20:19:24 +0000 2018",
+                              "2018-10-10T20:19:24Z",
+                              None, "", "not a date"])
+    assert dates.iloc[:3].tolist() == [CREATED_AT] * 3, dates.tolist()
+    assert dates.iloc[3:].isna().all(), dates.tolist()
+
+
+def check_get_num_days():
+    dates = parse_created_at([datetime(2018, 10, 10, 20, 19, 24),
+                              "Wed Oct 10 20:19:24 +0000 2018"])
+    num_days = get_num_days(dates, datetime(2018, 10, 20, 20, 19, 24, tzinfo=timezone.utc))
+    assert num_days.tolist() == [10, 10], num_days.tolist()
+    # less than a day old counts as a day
+    num_days = get_num_days(dates, datetime(2018, 10, 10, 22, 0, 0, tzinfo=timezone.utc))
+    assert num_days.tolist() == [1, 1], num_days.tolist()
+
+
+CHECKS = [
+    check_parse_created_at_datetimes,
+    check_parse_created_at_strings,
+    check_parse_created_at_mixed,
+    check_get_num_days
+]
+
+
+if __name__ == "__main__":
+    failures = 0
+    for this_check in CHECKS:
+        try:
+            this_check()
+        except AssertionError as error:
+            failures += 1
+            print(f'{this_check.__name__}: FAILED {error}')
+        else:
+            print(f'{this_check.__name__}: ok')
+    if failures:
+        print(f'{failures} of {len(CHECKS)} checks failed')
+        sys.exit(1)
+    print(f'all {len(CHECKS)} checks passed')
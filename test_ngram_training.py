@@ -0,0 +1,49 @@
+import argparse
+import filecmp
+import os
+import sys
+import tempfile
+import pandas as pd
+from ngram_classifier import NGramClassifier
+from train_ngram_classifier import CLASSES, TEXT_COLUMN, CLASS_COLUMN, get_training_chunks
+
+
+def train_and_save(input_path, output_path, workers, chunksize, binary):
+    classifier = NGramClassifier(classes=CLASSES, min_len=5, max_len=9)
+    df_chunks = pd.read_csv(input_path, keep_default_na=False,
+                            usecols=[TEXT_COLUMN, CLASS_COLUMN], chunksize=chunksize)
+    classifier.train_text_chunks(
+        get_training_chunks(df_chunks), workers=workers)
+    if binary:
+        classifier.serialize_compiled(output_path, max_to_save=100000)
+    else:
+        classifier.serialize(output_path, max_to_save=100000)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--input", help="training csv file")
+    parser.add_argument("-w", "--workers", type=int, default=3,
+                        help="number of processes to compare single process training with")
+    parser.add_argument("-c", "--chunksize", type=int, default=2500,
+                        help="number of rows read and counted at a time")
+    parser.add_argument("-b", "--binary", action="store_true",
+                        help="compare binary, memory-mappable models")
+    args = parser.parse_args()
+
+    if not args.input:
+        raise "missing input file"
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        serial_path = os.path.join(work_dir, "serial.dat")
+        parallel_path = os.path.join(work_dir, "parallel.dat")
+        train_and_save(args.input, serial_path, 1,
+                       args.chunksize, args.binary)
+        train_and_save(args.input, parallel_path, args.workers,
+                       args.chunksize, args.binary)
+        is_same = filecmp.cmp(serial_path, parallel_path, shallow=False)
+
+    if not is_same:
+        print(f'model trained with {args.workers} workers does NOT match the single process model')
+        sys.exit(1)
+    print(f'model trained with {args.workers} workers matches the single process model')
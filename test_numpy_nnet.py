@@ -0,0 +1,48 @@
+import argparse
+import sys
+import numpy
+import pandas as pd
+from ngram_classifier import NGramClassifier
+from nnet_model import NumpyNNet, get_input_matrix
+from run_nnet import is_bot_value, load_nnet
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--input", help="test input csv file")
+    parser.add_argument("-m", "--model", help="ngram model file")
+    parser.add_argument("-n", "--nnetmodel", help="Keras NNet model file")
+    parser.add_argument("-x", "--numpymodel",
+                        help="numpy nnet model file (exported from the Keras model when not given)")
+    parser.add_argument("-t", "--tolerance", type=float, default=1e-5,
+                        help="largest difference allowed between the predictions")
+    args = parser.parse_args()
+
+    if not args.input:
+        raise "missing input file"
+    if not args.model:
+        raise "missing ngram model file"
+    if not args.nnetmodel:
+        raise "missing nnet model file"
+
+    classifier = NGramClassifier(model_path=args.model)
+    keras_nnet = load_nnet(args.nnetmodel)
+    if args.numpymodel:
+        numpy_nnet = NumpyNNet.load(args.numpymodel)
+    else:
+        numpy_nnet = NumpyNNet.from_keras(keras_nnet)
+
+    df_test = pd.read_csv(args.input, keep_default_na=False)
+    targets_x = get_input_matrix(df_test, classifier)
+
+    keras_predictions = keras_nnet.predict(targets_x).ravel()
+    numpy_predictions = numpy_nnet.predict(targets_x).ravel()
+    max_difference = numpy.abs(keras_predictions - numpy_predictions).max()
+    label_mismatches = sum(is_bot_value(False, keras_value) != is_bot_value(False, numpy_value)
+                           for keras_value, numpy_value in zip(keras_predictions, numpy_predictions))
+
+    print(
+        f'rows: {len(targets_x)}, max difference: {max_difference}, label mismatches: {label_mismatches}')
+    if max_difference > args.tolerance or label_mismatches:
+        print("numpy nnet does NOT match the keras model")
+        sys.exit(1)
+    print("numpy nnet matches the keras model")
@@ -0,0 +1,118 @@
+import os
+import sys
+import tempfile
+import time
+from tweepy.models import User
+from twitter_lookup import TwitterUserLookup, TwitterUserCache
+
+TEST_CREDENTIALS = {
+    "consumer_key": "key",
+    "consumer_secret": "secret",
+    "access_token": "token",
+    "access_secret": "secret"
+}
+
+
+class LocalTwitterApi():
+    '''
+    stand-in for tweepy.API: every screen name exists, and the names of each
+    lookup_users request are recorded
+    '''
+
+    def __init__(self):
+        self.requested_names = []
+
+    def lookup_users(self, screen_name):
+        self.requested_names.extend(screen_name)
+        return [User.parse(None, get_user_json(this_name)) for this_name in screen_name]
+
+
+def get_user_json(screen_name):
+    return {"id": abs(hash(str(screen_name).lower())), "screen_name": str(screen_name),
+            "name": f'{screen_name} name', "description": "bio"}
+
+
+def get_local_lookup(cache):
+    twitter_lookup = TwitterUserLookup([TEST_CREDENTIALS], cache=cache)
+    twitter_api = LocalTwitterApi()
+    twitter_lookup._tokens[0].api = twitter_api
+    return twitter_lookup, twitter_api
+
+
+def check_case_insensitive_hits(cache_path):
+    cache = TwitterUserCache(cache_path)
+    cache.put_many([get_user_json("SomeUser")])
+    cached = cache.get_many(["someuser", "SOMEUSER", "other"])
+    cache.close()
+    assert list(cached) == ["someuser"], cached
+    assert cached["someuser"]["screen_name"] == "SomeUser", cached
+    assert (cache.hits, cache.misses) == (1, 1), (cache.hits, cache.misses)
+
+
+def check_ttl_expiry(cache_path):
+    cache = TwitterUserCache(cache_path, ttl_seconds=0.5)
+    cache.put_many([get_user_json("someuser")])
+    assert "someuser" in cache.get_many(["someuser"]), "fresh entry missed"
+    time.sleep(0.6)
+    assert not cache.get_many(["someuser"]), "stale entry returned"
+    assert cache.get_by_id(get_user_json("someuser")["id"]) is None, "stale entry returned by id"
+    cache.close()
+
+
+def check_get_by_id(cache_path):
+    cache = TwitterUserCache(cache_path)
+    user_json = get_user_json("someuser")
+    cache.put_many([user_json])
+    assert cache.get_by_id(user_json["id"]) == user_json, "user not found by id"
+    assert cache.get_by_id(str(user_json["id"])) == user_json, "user not found by id string"
+    assert cache.get_by_id(1) is None, "unknown id found"
+    cache.close()
+
+
+def check_numeric_names(cache_path):
+    # an all-digit screen name column is read from a csv as numbers
+    cache = TwitterUserCache(cache_path)
+    cache.put_many([get_user_json("007")])
+    assert list(cache.get_many([7, "007"])) == ["007"]
+    twitter_lookup, twitter_api = get_local_lookup(cache)
+    found_names = [this_user.screen_name
+                   for _, users in twitter_lookup.lookup([12345, "007"]) for this_user in users]
+    cache.close()
+    assert sorted(found_names) == ["007", "12345"], found_names
+    assert twitter_api.requested_names == [12345], twitter_api.requested_names
+
+
+def check_lookup_skips_cached_names(cache_path):
+    cache = TwitterUserCache(cache_path)
+    twitter_lookup, twitter_api = get_local_lookup(cache)
+    first_names = [f'user{i}' for i in range(250)]
+    list(twitter_lookup.lookup(first_names))
+    assert sorted(twitter_api.requested_names) == sorted(first_names)
+
+    twitter_api.requested_names.clear()
+    second_names = [this_name.upper() for this_name in first_names] + ["newuser"]
+    found_names = [this_user.screen_name
+                   for _, users in twitter_lookup.lookup(second_names) for this_user in users]
+    cache.close()
+    assert twitter_api.requested_names == ["newuser"], twitter_api.requested_names
+    assert sorted(found_names) == sorted(first_names + ["newuser"])
+
+
+CHECKS = [check_case_insensitive_hits, check_ttl_expiry, check_get_by_id,
+          check_numeric_names, check_lookup_skips_cached_names]
+
+if __name__ == "__main__":
+    failures = 0
+    with tempfile.TemporaryDirectory() as work_dir:
+        for this_check in CHECKS:
+            try:
+                this_check(os.path.join(work_dir, f'{this_check.__name__}.db'))
+            except AssertionError as error:
+                failures += 1
+                print(f'{this_check.__name__}: FAILED {error}')
+            else:
+                print(f'{this_check.__name__}: ok')
+    if failures:
+        print(f'{failures} of {len(CHECKS)} checks failed')
+        sys.exit(1)
+    print(f'all {len(CHECKS)} checks passed')
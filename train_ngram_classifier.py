@@ -6,10 +6,32 @@ CLASSES = ["bot", "good"]
 TEXT_COLUMN = "user_profile_description"
 CLASS_COLUMN = "class_value"
 
+
+def get_training_chunks(df_chunks):
+    '''
+    generator of the (texts, classes) of each frame, skipping rows
+    with an empty text or class
+    '''
+    rows_read = 0
+    for df in df_chunks:
+        texts = df[TEXT_COLUMN].astype(str)
+        classes = df[CLASS_COLUMN].astype(str)
+        has_values = (texts.str.len() > 0) & (classes.str.len() > 0)
+        rows_read += len(df.index)
+        print(f'training on {rows_read} rows')
+        yield texts[has_values].tolist(), classes[has_values].tolist()
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("-i", "--input", help="input csv file")
     parser.add_argument("-o", "--output", help="output file")
+    parser.add_argument("-b", "--binary", action="store_true",
+                        help="save as a binary, memory-mappable model")
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                        help="number of processes counting ngrams")
+    parser.add_argument("-c", "--chunksize", type=int,
+                        help="stream the input in chunks of this many rows")
     args = parser.parse_args()
 
     if not args.input:
@@ -19,19 +41,17 @@ if __name__ == "__main__":
 
     classifier = NGramClassifier(classes=CLASSES, min_len=5, max_len=9)
 
-    df = pd.read_csv(args.input, keep_default_na=False)
-    x_values = []
-    y_values = []
-    total_rows = len(df.index)
-    for index, row in df.iterrows():
-        this_text = str(row[TEXT_COLUMN])
-        this_class = str(row[CLASS_COLUMN])
-        if this_text and len(this_text) > 0 and this_class and len(this_class) > 0:
-            x_values.append(this_text)
-            y_values.append(this_class)
-
-        if index % 1000 == 0:
-            print(f'trained {index} of {total_rows}')
-
-    classifier.train_text(x_values, y_values)
-    classifier.serialize(args.output, max_to_save=100000)
+    if args.chunksize:
+        df_chunks = pd.read_csv(args.input, keep_default_na=False,
+                                usecols=[TEXT_COLUMN, CLASS_COLUMN],
+                                chunksize=args.chunksize)
+    else:
+        df_chunks = [pd.read_csv(args.input, keep_default_na=False,
+                                 usecols=[TEXT_COLUMN, CLASS_COLUMN])]
+
+    classifier.train_text_chunks(
+        get_training_chunks(df_chunks), workers=args.workers)
+    if args.binary:
+        classifier.serialize_compiled(args.output, max_to_save=100000)
+    else:
+        classifier.serialize(args.output, max_to_save=100000)
@@ -1,76 +1,19 @@
 import argparse
-import numpy
-from keras import backend as K
 from keras.models import Sequential
 from keras.layers import Dense
 import pandas as pd
 from ngram_classifier import NGramClassifier
+from nnet_model import get_input_matrix, get_training_outputs
+from nnet_model.keras_metrics import f1_m, precision_m, recall_m
 from sklearn.metrics import precision_recall_fscore_support
 from timeit import default_timer as timer
 
-CLASS_WEIGHTS = [
-    ("num_days", 0.997821848),
-    ("statuses_per_day", 1.065570851),
-    ("followers_per_day", 1.021055002),
-    ("following_per_day", 1.122703153),
-    ("desc_len_terms", 1.171072307),
-    ("num_list_items", 1.017727903),
-    ("num_hashtags", 0.889418197),
-    ("url_count", 1.018365516)
-]
-
-
-def get_input_vector(row, classifier):
-    '''
-    (classifier): p_good
-    (classifier): p_bot
-    num_days
-    statuses_per_day
-    followers_per_day
-    following_per_day
-    desc_len_terms
-    num_list_items
-    num_hashtags
-    url_count
-    '''
-    class_probs = classifier.classify_text(
-        str(row["user_profile_description"]))
-    ret = [class_probs["good"], class_probs["bot"]]
-    for label, weight in CLASS_WEIGHTS:
-        ret.append(float(row[label]) * weight)
-    return ret
-
-
-def get_training_output(row):
-    class_label = str(row["class_value"])
-    return 0.0 if class_label == "good" else 1.0
-
 
 def print_metrics(which_round, metrics):
     print(
         f'round: {which_round} : p() {metrics[0][0]:.4f}, {metrics[0][1]:.4f} : r() {metrics[1][0]:.4f}, {metrics[1][1]:.4f} : f() {metrics[2][0]:.4f}, {metrics[2][1]:.4f}')
 
 
-def recall_m(y_true, y_pred):
-    true_positives = K.sum(K.round(K.clip(y_true * y_pred, 0, 1)))
-    possible_positives = K.sum(K.round(K.clip(y_true, 0, 1)))
-    recall = true_positives / (possible_positives + K.epsilon())
-    return recall
-
-
-def precision_m(y_true, y_pred):
-    true_positives = K.sum(K.round(K.clip(y_true * y_pred, 0, 1)))
-    predicted_positives = K.sum(K.round(K.clip(y_pred, 0, 1)))
-    precision = true_positives / (predicted_positives + K.epsilon())
-    return precision
-
-
-def f1_m(y_true, y_pred):
-    precision = precision_m(y_true, y_pred)
-    recall = recall_m(y_true, y_pred)
-    return 2*((precision*recall)/(precision+recall+K.epsilon()))
-
-
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("-i", "--input", help="input csv file")
@@ -110,25 +53,15 @@ if __name__ == "__main__":
     # for i in range(0,num_training_rounds):
     start = timer()
     df_train = df.sample(frac=1.0).reset_index(drop=True)
-    x_values = []
-    y_values = []
-    for index, row in df_train.iterrows():
-        input_vector = get_input_vector(row, classifier)
-        output_val = get_training_output(row)
-        x_values.append(input_vector)
-        y_values.append(output_val)
-    nnet.fit(numpy.array(x_values), numpy.array(y_values),
+    x_values = get_input_matrix(df_train, classifier)
+    y_values = get_training_outputs(df_train)
+    nnet.fit(x_values, y_values,
              epochs=num_training_rounds, batch_size=25)
 
-    targets_x = []
-    targets_y = []
-    predictions = []
-    for index, row in df_test.iterrows():
-        input_vector = get_input_vector(row, classifier)
-        targets_x.append(input_vector)
-        targets_y.append(get_training_output(row))
+    targets_x = get_input_matrix(df_test, classifier)
+    targets_y = get_training_outputs(df_test)
     loss, accuracy, f1_score, precision, recall = nnet.evaluate(
-        numpy.array(targets_x), numpy.array(targets_y), verbose=0)
+        targets_x, targets_y, verbose=0)
 
     end = timer()
     run_time = (end - start)
@@ -1,3 +1,4 @@
+import argparse
 import csv
 import pandas as pd
 from ngram_classifier import NGramClassifier
@@ -7,6 +8,8 @@ from timeit import default_timer as timer
 CLASSES = ["bot", "good"]
 TEXT_COLUMN = "user_profile_description"
 CLASS_COLUMN = "class_value"
+NGRAM_MIN = 5
+NGRAM_MAX = 10
 
 training_data = "./resources/training.csv"
 testing_data = "./resources/test.csv"
@@ -14,22 +17,16 @@ metric_output = "./resources/test_ngram_metrics.csv"
 
 
 def get_xy_for_data(df):
-    x_values = []
-    y_values = []
-    for index, row in df_train.iterrows():
-        this_text = str(row[TEXT_COLUMN])
-        this_class = str(row[CLASS_COLUMN])
-        if this_text and len(this_text) > 0 and this_class and len(this_class) > 0:
-            x_values.append(this_text)
-            y_values.append(this_class)
-    return x_values, y_values
+    texts = df[TEXT_COLUMN].astype(str)
+    classes = df[CLASS_COLUMN].astype(str)
+    has_values = (texts.str.len() > 0) & (classes.str.len() > 0)
+    return texts[has_values].tolist(), classes[has_values].tolist()
 
 
-df_train = pd.read_csv(training_data, keep_default_na=False)
-train_x, train_y = get_xy_for_data(df_train)
-
-df_test = pd.read_csv(testing_data, keep_default_na=False)
-test_x, test_y = get_xy_for_data(df_test)
+def get_ngram_ranges():
+    return [(ngram_min, ngram_max)
+            for ngram_min in range(NGRAM_MIN, NGRAM_MAX)
+            for ngram_max in range(ngram_min, NGRAM_MAX)]
 
 
 def print_metrics(metrics):
@@ -43,41 +40,74 @@ def print_metrics(metrics):
         f'counts: ({CLASSES[0]}) {metrics[3][0]}, ({CLASSES[1]}) {metrics[3][1]}')
 
 
-def get_prediction(p):
-    return CLASSES[0] if p[CLASSES[0]] > p[CLASSES[1]] else CLASSES[1]
-
-
-def run_class_and_test(ngram_min, ngram_max):
-    classifier = NGramClassifier(
-        classes=CLASSES, min_len=ngram_min, max_len=ngram_max)
-    classifier.train_text(train_x, train_y)
-    classifier.update_counts()
-
-    predicted = classifier.classify_text_list(test_x)
+def get_predictions(predicted):
+    return [CLASSES[0] if p[0] > p[1] else CLASSES[1] for p in predicted]
 
-    predictions = []
-    for i in range(0, len(test_x)):
-        predictions.append(get_prediction(predicted[i]))
 
-    return precision_recall_fscore_support(test_y, predictions)
+def run_sweep(train_x, train_y, test_x, test_y, workers=1):
+    '''
+    trains one classifier over the widest ngram range and scores the test set with
+    every (ngram_min, ngram_max) sub-range of it: each ngram value's counts and test
+    scores are the same whichever range it is part of, so nothing is retrained.
 
-
-out_cols = ["range", f"p({CLASSES[0]})", f"p({CLASSES[1]})", f"r({CLASSES[0]})",
-            f"r({CLASSES[1]})", f"f({CLASSES[0]})", f"f({CLASSES[1]})", "time"]
-
-with open(metric_output, 'w') as metric_out:
-    csv_writer = csv.writer(metric_out, delimiter=',',
-                            quotechar='"', quoting=csv.QUOTE_MINIMAL)
-    csv_writer.writerow(out_cols)
-    for ngram_min in range(5, 10):
-        for ngram_max in range(ngram_min, 10):
+    the time yielded for each range is its share of the training and scoring plus
+    its own metrics, so the times add up to the whole sweep
+    '''
+    start = timer()
+    classifier = NGramClassifier(
+        classes=CLASSES, min_len=NGRAM_MIN, max_len=NGRAM_MAX)
+    classifier.train_text(train_x, train_y, workers=workers)
+    train_time = timer() - start
+    print(f'trained ngrams({NGRAM_MIN},{NGRAM_MAX}) in {train_time:.2f}s')
+
+    start = timer()
+    ngram_ranges = get_ngram_ranges()
+    predicted = classifier.classify_text_matrix_ranges(
+        test_x, ngram_ranges, workers=workers)
+    classifier.close_pool()
+    score_time = timer() - start
+    print(f'scored {len(ngram_ranges)} ranges in {score_time:.2f}s')
+
+    shared_time = (train_time + score_time) / len(ngram_ranges)
+    for ngram_range in ngram_ranges:
+        start = timer()
+        metrics = precision_recall_fscore_support(
+            test_y, get_predictions(predicted[ngram_range]))
+        yield ngram_range, metrics, shared_time + timer() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--input", default=training_data,
+                        help="training csv file")
+    parser.add_argument("-t", "--testfile", default=testing_data,
+                        help="testing csv file")
+    parser.add_argument("-o", "--output", default=metric_output,
+                        help="output metrics csv file")
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                        help="number of processes used to train and score")
+    args = parser.parse_args()
+
+    df_train = pd.read_csv(args.input, keep_default_na=False,
+                           usecols=[TEXT_COLUMN, CLASS_COLUMN])
+    train_x, train_y = get_xy_for_data(df_train)
+
+    df_test = pd.read_csv(args.testfile, keep_default_na=False,
+                          usecols=[TEXT_COLUMN, CLASS_COLUMN])
+    test_x, test_y = get_xy_for_data(df_test)
+
+    out_cols = ["range", f"p({CLASSES[0]})", f"p({CLASSES[1]})", f"r({CLASSES[0]})",
+                f"r({CLASSES[1]})", f"f({CLASSES[0]})", f"f({CLASSES[1]})", "time"]
+
+    with open(args.output, 'w') as metric_out:
+        csv_writer = csv.writer(metric_out, delimiter=',',
+                                quotechar='"', quoting=csv.QUOTE_MINIMAL)
+        csv_writer.writerow(out_cols)
+        for (ngram_min, ngram_max), metrics, run_time in run_sweep(train_x, train_y,
+                                                                   test_x, test_y,
+                                                                   args.workers):
             print('----------------')
             print(f'testing ngrams({ngram_min},{ngram_max})')
-
-            start = timer()
-            metrics = run_class_and_test(ngram_min, ngram_max)
-            end = timer()
-            run_time = (end - start)
             print_metrics(metrics)
 
             metrics_row = [f'ngrams({ngram_min},{ngram_max})',
@@ -88,4 +118,4 @@ with open(metric_output, 'w') as metric_out:
                            ]
             csv_writer.writerow(metrics_row)
 
-print('---- DONE ----')
+    print('---- DONE ----')
@@ -0,0 +1,303 @@
+import argparse
+import collections
+from datetime import datetime, timezone
+import glob
+import os
+import queue
+import threading
+import pandas as pd
+from discovertext_api import DiscoverTextApi
+from ngram_classifier import NGramClassifier
+from twitter_lookup import TwitterUserLookup, TwitterUserCache
+from utils import get_twitter_auth_list, iter_batches
+from extract_users_from_csvs import SCREEN_NAME_COLUMN, get_user_records
+from extract_users_from_dt import get_unit_screen_names, save_screen_names
+from run_nnet import load_nnet, score_frame
+
+LOOKUP_BATCH_SIZE = 100
+
+# marks the end of a stage's output on its queue
+_STAGE_DONE = object()
+
+
+class PipelineStopped(Exception):
+    pass
+
+
+class Pipeline():
+    '''
+    runs the scoring pipeline in a single process:
+
+        screen names -> hydrated users -> features and scores
+
+    each stage runs in its own thread (the lookups sending their requests from a pool
+    of threads) and hands its output to the next through a bounded queue, so network
+    lookups overlap with scoring and only queue_size batches are held between stages. If any stage fails the others are stopped and
+    the error is raised from run.
+
+    with workers > 1 the classifier's process pool (see NGramClassifier.start_pool)
+    is started before the stage threads, and kept for the caller to close
+    '''
+
+    def __init__(self, twitter_lookup, classifier, nnet, queue_size=8,
+                 workers=1, chunksize=1000):
+        self._twitter_lookup = twitter_lookup
+        self._classifier = classifier
+        self._nnet = nnet
+        self._workers = workers
+        self._chunksize = chunksize
+        self._name_queue = queue.Queue(maxsize=queue_size)
+        self._user_queue = queue.Queue(maxsize=queue_size)
+        self._stop_event = threading.Event()
+        self._errors = []
+
+    def _put(self, item_queue, item):
+        while not self._stop_event.is_set():
+            try:
+                item_queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+        raise PipelineStopped()
+
+    def _iter_queue(self, item_queue, num_producers):
+        remaining = num_producers
+        while remaining:
+            if self._stop_event.is_set():
+                raise PipelineStopped()
+            try:
+                item = item_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if item is _STAGE_DONE:
+                remaining -= 1
+            else:
+                yield item
+
+    def _run_stage(self, stage_function, output_queue, *args):
+        # every stage thread signals the end of its output, even when it failed
+        try:
+            stage_function(*args)
+        except PipelineStopped:
+            pass
+        except Exception as error:
+            self._errors.append(error)
+            self._stop_event.set()
+        finally:
+            try:
+                self._put(output_queue, _STAGE_DONE)
+            except PipelineStopped:
+                pass
+
+    def _read_names(self, screen_names):
+        for this_batch in iter_batches(screen_names, LOOKUP_BATCH_SIZE):
+            self._put(self._name_queue, this_batch)
+
+    def _iter_names(self):
+        for this_batch in self._iter_queue(self._name_queue, 1):
+            yield from this_batch
+
+    def _hydrate_users(self):
+        todays_date = datetime.now(timezone.utc)
+        # a single lookup of all the names, which runs the concurrent requests itself
+        lookup_results = self._twitter_lookup.lookup(self._iter_names())
+        try:
+            for _, user_data in lookup_results:
+                user_records = get_user_records(user_data, todays_date)
+                if user_records:
+                    self._put(self._user_queue, user_records)
+        finally:
+            # cancels the lookups not yet started if the pipeline stopped early
+            lookup_results.close()
+
+    def _score_users(self, output_file, userdat_output_file=None):
+        # users read so far give the row index, verified users are dropped
+        # from the output so rows_scored counts what was written
+        rows_read = 0
+        rows_scored = 0
+        pending_records = []
+
+        def score_pending():
+            nonlocal rows_read, rows_scored
+            df_chunk = pd.DataFrame(pending_records)
+            df_chunk.index += rows_read
+            if userdat_output_file:
+                df_chunk.to_csv(userdat_output_file, mode='a' if rows_read else 'w',
+                                header=not rows_read)
+            df_chunk = score_frame(
+                df_chunk, self._classifier, self._nnet, self._workers)
+            df_chunk.to_csv(output_file, mode='a' if rows_read else 'w',
+                            header=not rows_read)
+            rows_read += len(pending_records)
+            rows_scored += len(df_chunk.index)
+            pending_records.clear()
+            print(f'... scored {rows_scored} users')
+
+        for user_records in self._iter_queue(self._user_queue, 1):
+            pending_records.extend(user_records)
+            if len(pending_records) >= self._chunksize:
+                score_pending()
+        if pending_records:
+            score_pending()
+        return rows_scored
+
+    def run(self, screen_names, output_file, userdat_output_file=None):
+        '''
+        looks up and scores the screen names (any iterable, read lazily), writing
+        the scored users to output_file and optionally the hydrated users to
+        userdat_output_file. Returns the number of users scored
+        '''
+        if self._workers > 1:
+            self._classifier.start_pool(self._workers)
+        threads = [threading.Thread(target=self._run_stage,
+                                    args=(self._read_names, self._name_queue, screen_names)),
+                   threading.Thread(target=self._run_stage,
+                                    args=(self._hydrate_users, self._user_queue))]
+        for this_thread in threads:
+            this_thread.daemon = True
+            this_thread.start()
+
+        try:
+            rows_scored = self._score_users(output_file, userdat_output_file)
+        except PipelineStopped:
+            rows_scored = 0
+        except BaseException:
+            self._stop_event.set()
+            raise
+        finally:
+            for this_thread in threads:
+                this_thread.join()
+        if self._errors:
+            raise self._errors[0]
+        return rows_scored
+
+
+def iter_dt_screen_names(dt_api, entity_type, entity_id, screen_names, page_size=100):
+    '''
+    generator of the unique screen names in a DiscoverText archive/bucket, in the order
+    first seen. screen_names (a Counter) is updated with the total for every name
+    '''
+    if entity_type == "archive":
+        units = dt_api.iter_archive_units(
+            entity_id, page_size=page_size, include_metadata=True)
+    else:
+        units = dt_api.iter_bucket_units(
+            entity_id, page_size=page_size, include_metadata=True)
+    for this_unit in units:
+        for this_screen_name in get_unit_screen_names(this_unit):
+            if this_screen_name not in screen_names:
+                yield this_screen_name
+            screen_names[this_screen_name] += 1
+
+
+def iter_csv_screen_names(input_path):
+    '''
+    generator of the unique screen names in a csv file or a directory of csv files
+    '''
+    if os.path.isdir(input_path):
+        all_files = glob.glob(os.path.join(input_path, "*.csv"))
+    elif os.path.isfile(input_path):
+        all_files = [input_path]
+    else:
+        raise "Unknown input"
+
+    screen_names = set()
+    for this_file in all_files:
+        print(f'... reading {this_file}')
+        df = pd.read_csv(this_file, keep_default_na=False)
+        for this_screen_name in df[SCREEN_NAME_COLUMN]:
+            if this_screen_name not in screen_names:
+                screen_names.add(this_screen_name)
+                yield this_screen_name
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--input", help="input csv file or directory of screen names")
+    parser.add_argument("-d", "--dtcredentials", help="DiscoverText credentials file")
+    parser.add_argument("-a", "--archive", help="DiscoverText archive to score")
+    parser.add_argument("-b", "--bucket", help="DiscoverText bucket to score")
+    parser.add_argument("-c", "--credentials", help="twitter credentials file")
+    parser.add_argument("-m", "--model", help="ngram model file")
+    parser.add_argument("-n", "--nnetmodel", help="NNet model file")
+    parser.add_argument("-o", "--output", help="output (scored) csv file")
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                        help="number of processes used to score")
+    parser.add_argument("-t", "--concurrency", type=int, default=2,
+                        help="concurrent requests per set of twitter credentials")
+    parser.add_argument("-p", "--pagesize", type=int, default=100,
+                        help="number of DiscoverText units per page request")
+    parser.add_argument("--chunksize", type=int, default=1000,
+                        help="number of users scored at a time")
+    parser.add_argument("--queuesize", type=int, default=8,
+                        help="number of batches held between pipeline stages")
+    parser.add_argument("--cache", help="user profile cache file (sqlite)")
+    parser.add_argument("--cache-ttl", type=float, default=24,
+                        help="hours before a cached user profile is refetched")
+    parser.add_argument("--names-output",
+                        help="also write the DiscoverText screen name totals to this csv file")
+    parser.add_argument("--userdat-output",
+                        help="also write the hydrated user data to this csv file")
+    args = parser.parse_args()
+
+    if not args.input and not args.archive and not args.bucket:
+        raise "missing input file, archive or bucket"
+    if (args.archive or args.bucket) and not args.dtcredentials:
+        raise "missing DiscoverText credentials file"
+    if args.archive and args.bucket:
+        raise "cannot use --archive and --bucket flag at the same time"
+    if not args.credentials:
+        raise "missing twitter credentials file"
+    if not args.model:
+        raise "missing ngram model file"
+    if not args.nnetmodel:
+        raise "missing nnet model file"
+    if not args.output:
+        raise "missing output file"
+
+    classifier = NGramClassifier(model_path=args.model)
+    if args.workers > 1:
+        # fork the scoring pool before anything starts a thread or opens a connection
+        classifier.start_pool(args.workers)
+    nnet = load_nnet(args.nnetmodel)
+
+    user_cache = None
+    if args.cache:
+        user_cache = TwitterUserCache(
+            args.cache, ttl_seconds=args.cache_ttl * 60 * 60)
+    twitter_credentials = get_twitter_auth_list(args.credentials)
+    twitter_lookup = TwitterUserLookup(twitter_credentials,
+                                       concurrency_per_token=args.concurrency,
+                                       cache=user_cache)
+
+    dt_screen_names = collections.Counter()
+    if args.input:
+        screen_names = iter_csv_screen_names(args.input)
+    else:
+        dt_api = DiscoverTextApi(credential_file=args.dtcredentials)
+        dt_api.login()
+        if args.archive:
+            screen_names = iter_dt_screen_names(
+                dt_api, "archive", args.archive, dt_screen_names, args.pagesize)
+        else:
+            screen_names = iter_dt_screen_names(
+                dt_api, "bucket", args.bucket, dt_screen_names, args.pagesize)
+
+    pipeline = Pipeline(twitter_lookup, classifier, nnet,
+                        queue_size=args.queuesize,
+                        workers=args.workers,
+                        chunksize=args.chunksize)
+    try:
+        rows_scored = pipeline.run(screen_names, args.output,
+                                   userdat_output_file=args.userdat_output)
+    finally:
+        classifier.close_pool()
+    print(f'total output of {rows_scored} users...')
+
+    if args.names_output and dt_screen_names:
+        print(f'Writing screen names to: {args.names_output}')
+        save_screen_names(dt_screen_names, args.names_output)
+    if user_cache:
+        print(
+            f'... user cache: {user_cache.hits} hits, {user_cache.misses} misses')
+        user_cache.close()
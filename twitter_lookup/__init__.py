@@ -0,0 +1,2 @@
+from .twitter_user_lookup import TwitterUserLookup
+from .twitter_user_cache import TwitterUserCache
@@ -0,0 +1,79 @@
+import json
+import sqlite3
+import threading
+import time
+from utils import batch_list
+
+
+class TwitterUserCache():
+    '''
+    On-disk (SQLite) cache of hydrated Twitter user profiles, keyed by
+    (case-insensitive) screen name and user id. Entries older than
+    ttl_seconds are treated as misses.
+    '''
+    # sqlite's default limit on the number of bound parameters is 999
+    QUERY_BATCH_SIZE = 500
+
+    def __init__(self, cache_path, ttl_seconds=24 * 60 * 60):
+        self._ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            cache_path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute('''CREATE TABLE IF NOT EXISTS users (
+                                            screen_name TEXT PRIMARY KEY,
+                                            user_id TEXT,
+                                            fetched_at REAL NOT NULL,
+                                            data TEXT NOT NULL)''')
+            self._connection.execute(
+                'CREATE INDEX IF NOT EXISTS users_user_id ON users (user_id)')
+        self.hits = 0
+        self.misses = 0
+
+    def _get_min_fetched_at(self):
+        if self._ttl_seconds is None:
+            return 0
+        return time.time() - self._ttl_seconds
+
+    def get_many(self, screen_names):
+        '''
+        returns a dictionary of { lowercased screen_name: user json } for the
+        screen names with a fresh cache entry
+        '''
+        ret = {}
+        # names read from a csv column can be numbers
+        lowered = list({str(this_name).lower() for this_name in screen_names})
+        min_fetched_at = self._get_min_fetched_at()
+        with self._lock:
+            for this_batch in batch_list(lowered, TwitterUserCache.QUERY_BATCH_SIZE):
+                if not this_batch:
+                    continue
+                placeholders = ",".join("?" * len(this_batch))
+                rows = self._connection.execute(
+                    f'SELECT screen_name, data FROM users WHERE fetched_at >= ? AND screen_name IN ({placeholders})',
+                    [min_fetched_at] + this_batch)
+                for screen_name, data in rows:
+                    ret[screen_name] = json.loads(data)
+            self.hits += len(ret)
+            self.misses += len(lowered) - len(ret)
+        return ret
+
+    def get_by_id(self, user_id):
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT data FROM users WHERE fetched_at >= ? AND user_id = ?',
+                [self._get_min_fetched_at(), str(user_id)]).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_many(self, user_jsons):
+        ''' stores the raw user json (as returned by the Twitter API) for each user '''
+        fetched_at = time.time()
+        rows = [(this_user["screen_name"].lower(), str(this_user.get("id")), fetched_at, json.dumps(this_user))
+                for this_user in user_jsons]
+        with self._lock, self._connection:
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO users (screen_name, user_id, fetched_at, data) VALUES (?, ?, ?, ?)', rows)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,212 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import tweepy
+from tweepy.models import User
+from utils import iter_batches
+
+
+class RateLimitedToken():
+    '''
+    one set of Twitter credentials, tracking its own rate limit window
+    '''
+
+    def __init__(self, api, requests_per_window, window_seconds):
+        self.api = api
+        self.in_flight = 0
+        self._requests_per_window = requests_per_window
+        self._window_seconds = window_seconds
+        self._window_reset = 0
+        self._remaining = requests_per_window
+
+    def get_wait_time(self, now):
+        ''' seconds until this token can send another request (0 if it can now) '''
+        if now >= self._window_reset:
+            return 0
+        if self._remaining > 0:
+            return 0
+        return self._window_reset - now
+
+    def take(self, now):
+        if now >= self._window_reset:
+            self._window_reset = now + self._window_seconds
+            self._remaining = self._requests_per_window
+        self._remaining -= 1
+        self.in_flight += 1
+
+    def set_exhausted(self, reset_time):
+        self._window_reset = max(reset_time, time.time())
+        self._remaining = 0
+
+
+class TwitterUserLookup():
+    '''
+    Looks up Twitter users by screen name in batches of 100, running batches concurrently
+    across one or more credential sets and keeping each one within its rate limit window
+
+    If a TwitterUserCache is given, it is consulted first and only the misses
+    (and stale entries) are looked up from the API
+    '''
+    BATCH_SIZE = 100
+
+    def __init__(self, credentials_list, concurrency_per_token=2,
+                 requests_per_window=900, window_seconds=900,
+                 max_retries=5, backoff_base=2.0, backoff_max=300, cache=None):
+
+        if not credentials_list:
+            raise ValueError("missing twitter credentials")
+
+        self._tokens = [RateLimitedToken(TwitterUserLookup.create_api(credentials),
+                                         requests_per_window, window_seconds)
+                        for credentials in credentials_list]
+        self._concurrency_per_token = concurrency_per_token
+        self._max_retries = max_retries
+        self._backoff_base = backoff_base
+        self._backoff_max = backoff_max
+        self._cache = cache
+        self._condition = threading.Condition()
+
+    @staticmethod
+    def create_api(credentials):
+        twitter_auth = tweepy.OAuthHandler(
+            credentials["consumer_key"], credentials["consumer_secret"])
+        twitter_auth.set_access_token(
+            credentials["access_token"], credentials["access_secret"])
+        # rate limits are scheduled here, across all the tokens
+        return tweepy.API(twitter_auth, wait_on_rate_limit=False)
+
+    def _acquire_token(self):
+        with self._condition:
+            while True:
+                now = time.time()
+                available = [token for token in self._tokens
+                             if token.in_flight < self._concurrency_per_token and
+                             token.get_wait_time(now) == 0]
+                if available:
+                    token = min(available, key=lambda x: x.in_flight)
+                    token.take(now)
+                    return token
+                wait_times = [token.get_wait_time(now) for token in self._tokens
+                              if token.get_wait_time(now) > 0]
+                self._condition.wait(
+                    timeout=min(wait_times) if wait_times else None)
+
+    def _release_token(self, token):
+        with self._condition:
+            token.in_flight -= 1
+            self._condition.notify_all()
+
+    def _get_backoff(self, retry_count):
+        backoff = min(self._backoff_max,
+                      self._backoff_base * (2 ** retry_count))
+        return backoff * random.uniform(0.5, 1.0)
+
+    def _set_rate_limited(self, token, e):
+        reset_time = None
+        if getattr(e, "response", None) is not None:
+            reset_time = e.response.headers.get("x-rate-limit-reset")
+        with self._condition:
+            if reset_time:
+                token.set_exhausted(int(reset_time))
+            else:
+                token.set_exhausted(time.time() + self._backoff_max)
+            self._condition.notify_all()
+
+    def lookup_batch(self, screen_names):
+        '''
+        looks up a single batch (up to 100) of screen names, retrying with exponential backoff.
+        returns the list of users found, or an empty list if the batch could not be fetched
+        '''
+        retry_count = 0
+        while True:
+            token = self._acquire_token()
+            try:
+                return token.api.lookup_users(screen_name=screen_names)
+            except tweepy.NotFound:
+                # none of the screen names in the batch exist
+                return []
+            except tweepy.TooManyRequests as e:
+                # waiting for the window to reset is handled by _acquire_token,
+                # so this doesn't count as a retry
+                self._set_rate_limited(token, e)
+                continue
+            except (tweepy.BadRequest, tweepy.Unauthorized) as e:
+                print(f'exception: {e}')
+                print('... not retryable... skipping...')
+                return []
+            except Exception as e:
+                error = e
+            finally:
+                self._release_token(token)
+
+            retry_count += 1
+            if retry_count > self._max_retries:
+                print(f'exception: {error}')
+                print('... too many retrys... skipping...')
+                return []
+            print(
+                f'!! exception getting Twitter API data... retry {retry_count} of {self._max_retries}...')
+            time.sleep(self._get_backoff(retry_count))
+
+    def _iter_api_batches(self, screen_names, batch_size):
+        '''
+        generator of the batches of screen_names to look up from the API, yielding
+        the (batch, users) of the cached names as they are found
+        '''
+        if not self._cache:
+            yield from ((this_batch, None) for this_batch in iter_batches(screen_names, batch_size))
+            return
+        missed_names = []
+        for this_batch in iter_batches(screen_names, batch_size):
+            cached = self._cache.get_many(this_batch)
+            cached_names = [this_name for this_name in this_batch
+                            if str(this_name).lower() in cached]
+            if cached_names:
+                yield cached_names, [User.parse(None, cached[str(this_name).lower()])
+                                     for this_name in cached_names]
+            missed_names.extend(this_name for this_name in this_batch
+                                if str(this_name).lower() not in cached)
+            # the misses are gathered into full batches before being looked up
+            while len(missed_names) >= batch_size:
+                yield missed_names[:batch_size], None
+                del missed_names[:batch_size]
+        if missed_names:
+            yield missed_names, None
+
+    def lookup(self, screen_names, batch_size=BATCH_SIZE):
+        '''
+        generator looking up all the screen names (any iterable, read lazily), yielding
+        (batch, users) tuples as each batch completes
+
+        only a window of batches (twice the number of concurrent requests) is looked
+        up ahead of the consumer, so memory doesn't grow with the input, and batches
+        not yet started are cancelled when the generator is closed early
+        '''
+        max_workers = len(self._tokens) * self._concurrency_per_token
+        max_in_flight = max_workers * 2
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        in_flight = {}
+        try:
+            for this_batch, users in self._iter_api_batches(screen_names, batch_size):
+                if users is not None:
+                    yield this_batch, users
+                    continue
+                in_flight[executor.submit(
+                    self.lookup_batch, this_batch)] = this_batch
+                while len(in_flight) >= max_in_flight:
+                    yield from self._pop_completed(in_flight)
+            while in_flight:
+                yield from self._pop_completed(in_flight)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _pop_completed(self, in_flight):
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in done:
+            this_batch = in_flight.pop(future)
+            users = future.result()
+            if self._cache and users:
+                self._cache.put_many(
+                    [this_user._json for this_user in users])
+            yield this_batch, users
@@ -1,2 +1,4 @@
-from .app_utils import batch_list, get_twitter_auth
+from .app_utils import batch_list, iter_batches, get_twitter_auth, get_twitter_auth_list
+from .metrics import get_metrics, add_metrics_arguments, start_metrics, finish_metrics
 from .text_utils import get_ngrams, count_ngrams, count_repeating_ngrams, clean_text, tokenize, get_list_item_count, get_hashtag_count, get_url_count, get_urls, get_hashtags
+from .bio_features import BIO_FEATURE_COLUMNS, get_bio_feature_frame, parse_created_at, get_num_days
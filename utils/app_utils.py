@@ -1,4 +1,5 @@
 from functools import reduce
+from itertools import islice
 import json
 
 def batch_list(input_list, batch_size):
@@ -12,12 +13,38 @@ def batch_list(input_list, batch_size):
     return reduce(reducer, input_list, [[]])
 
 
+def iter_batches(input_iterable, batch_size):
+    '''
+    lazy version of batch_list: yields lists of up to batch_size items as they are read
+    '''
+    iterator = iter(input_iterable)
+    while True:
+        this_batch = list(islice(iterator, batch_size))
+        if not this_batch:
+            return
+        yield this_batch
+
+
+def _get_twitter_credentials(credentials):
+    return {
+        "consumer_key": credentials["consumer_key"],
+        "consumer_secret": credentials["consumer_secret"],
+        "access_token": credentials["access_token"],
+        "access_secret": credentials["access_secret"]
+    }
+
+
 def get_twitter_auth(auth_file):
+    return get_twitter_auth_list(auth_file)[0]
+
+
+def get_twitter_auth_list(auth_file):
+    '''
+    reads one or more sets of Twitter credentials: the file holds either
+    a single credentials object or a list of them
+    '''
     with open(auth_file) as auth_file_handle:
         credentials = json.load(auth_file_handle)
-        return {
-            "consumer_key": credentials["consumer_key"],
-            "consumer_secret": credentials["consumer_secret"],
-            "access_token": credentials["access_token"],
-            "access_secret": credentials["access_secret"]
-        }
+        if isinstance(credentials, dict):
+            credentials = [credentials]
+        return [_get_twitter_credentials(this_credentials) for this_credentials in credentials]
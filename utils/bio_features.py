@@ -0,0 +1,109 @@
+import multiprocessing
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from nltk import word_tokenize
+from .text_utils import get_hashtag_count, regex_list_separators, regex_urls
+
+BIO_FEATURE_COLUMNS = ["desc_len_terms", "desc_len_chars",
+                       "num_list_items", "num_hashtags", "url_count"]
+
+# e.g. "Wed Oct 10 20:19:24 +0000 2018"
+TWITTER_DATE_FORMAT = "%a %b %d %H:%M:%S %z %Y"
+
+
+def _get_token_counts(bios):
+    '''
+    returns a (len(bios), 2) array of the number of word terms and of hashtags
+    in each bio, from its nltk word tokens
+    '''
+    counts = np.zeros((len(bios), 2), dtype=np.int64)
+    for row, this_bio in enumerate(bios):
+        tokens = word_tokenize(this_bio)
+        counts[row, 0] = sum(1 for word in tokens if word.isalpha())
+        counts[row, 1] = get_hashtag_count(tokens)
+    return counts
+
+
+def get_bio_feature_frame(bios, workers=1, pool=None):
+    '''
+    computes the bio features of extract_users_from_csvs.get_user_add_props for a
+    batch of bios, returning a frame with the BIO_FEATURE_COLUMNS in the same order.
+
+    the character, list item and url counts are vectorized over the batch; the
+    word tokenizing, for the term and hashtag counts, is done once per distinct bio
+    and with workers > 1 split between a process pool: pool, if given, otherwise one
+    started for this call. Callers running threads (e.g. twitter lookups) should
+    pass a pool started before them, as forking while a thread holds a lock can
+    leave the workers deadlocked
+    '''
+    bio_texts = pd.Series(list(bios), dtype=object).fillna(
+        "").astype(str).str.strip()
+    codes, unique_bios = pd.factorize(bio_texts)
+    unique_bios = list(unique_bios)
+
+    if workers > 1 and len(unique_bios) > workers:
+        shard_size = -(-len(unique_bios) // (workers * 4))
+        shards = [unique_bios[start:start + shard_size]
+                  for start in range(0, len(unique_bios), shard_size)]
+        if pool is not None:
+            token_counts = np.vstack(pool.map(_get_token_counts, shards))
+        else:
+            with multiprocessing.Pool(workers) as this_pool:
+                token_counts = np.vstack(
+                    this_pool.map(_get_token_counts, shards))
+    else:
+        token_counts = _get_token_counts(unique_bios)
+    token_counts = token_counts[codes]
+
+    return pd.DataFrame({
+        "desc_len_terms": token_counts[:, 0],
+        "desc_len_chars": bio_texts.str.len().to_numpy(dtype=np.int64),
+        # splitting on the separators gives one more item than there are separators
+        "num_list_items": bio_texts.str.count(regex_list_separators.pattern).to_numpy(dtype=np.int64) + 1,
+        "num_hashtags": token_counts[:, 1],
+        "url_count": bio_texts.str.count(regex_urls.pattern).to_numpy(dtype=np.int64)
+    }, columns=BIO_FEATURE_COLUMNS)
+
+
+def _to_utc_timestamp(value):
+    timestamp = pd.Timestamp(value)
+    if timestamp.tzinfo is None:
+        return timestamp.tz_localize("UTC")
+    return timestamp.tz_convert("UTC")
+
+
+def parse_created_at(created_at_values):
+    '''
+    parses a batch of account creation dates, either datetimes (naive ones being UTC)
+    or date strings, as Twitter returns them or in any format pandas recognizes.
+    Returns a series of UTC timestamps, NaT where a date is missing or unreadable
+    '''
+    values = pd.Series(list(created_at_values), dtype=object)
+    dates = pd.Series(pd.NaT, index=values.index, dtype="datetime64[ns, UTC]")
+
+    # tweepy gives datetimes, which need no parsing
+    is_datetime = values.map(lambda value: isinstance(value, datetime))
+    if is_datetime.any():
+        dates[is_datetime] = [_to_utc_timestamp(value)
+                              for value in values[is_datetime]]
+
+    is_string = values.map(lambda value: isinstance(value, str) and bool(value.strip()))
+    if is_string.any():
+        dates[is_string] = pd.to_datetime(values[is_string].tolist(), utc=True,
+                                          errors='coerce', format=TWITTER_DATE_FORMAT)
+        # any other format is parsed date by date, so that one format isn't inferred
+        # for all of them
+        unparsed = is_string & dates.isna()
+        for index in unparsed[unparsed].index:
+            dates[index] = pd.to_datetime(values[index], utc=True, errors='coerce')
+    return dates
+
+
+def get_num_days(dates, todays_date):
+    '''
+    returns the number of whole days from each date to todays_date, counting a
+    date less than a day old as 1 day
+    '''
+    num_days = (pd.Timestamp(todays_date) - dates).dt.days
+    return num_days.where(num_days != 0, 1)
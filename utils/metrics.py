@@ -0,0 +1,253 @@
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows: memory is then not reported
+    resource = None
+
+METRICS_PREFIX = "trust_defender"
+METRICS_FORMATS = ["json", "prometheus"]
+
+
+def _get_max_rss_bytes(who="RUSAGE_SELF"):
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(getattr(resource, who)).ru_maxrss
+    # kilobytes on linux, bytes on macOS
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def get_rss_bytes():
+    '''
+    returns the resident memory of this process, or its peak where the
+    current value isn't available
+    '''
+    try:
+        with open("/proc/self/statm", 'r') as statm_file:
+            return int(statm_file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return _get_max_rss_bytes()
+
+
+class Metrics():
+    '''
+    per-stage timers and counters of a run, shared by the scripts and the code they
+    call (see get_metrics). Nothing is recorded until enable is called, so the
+    timers can stay in place around the hot paths.
+
+    counters named {name}_hits and {name}_misses are reported as a {name} cache hit
+    rate, and while enabled the resident memory is sampled every sample_interval
+    seconds
+    '''
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._counters = {}
+        self._rss_samples = []
+        self._start_time = None
+        self._end_time = None
+        self._sample_interval = 1.0
+        self._stop_event = threading.Event()
+        self._sampler = None
+
+    def enable(self, sample_interval=1.0):
+        self.enabled = True
+        self._start_time = time.perf_counter()
+        self._end_time = None
+        self._sample_interval = sample_interval
+        self._stop_event.clear()
+        self._sample_rss()
+        self._sampler = threading.Thread(target=self._run_sampler, daemon=True)
+        self._sampler.start()
+
+    def disable(self):
+        if not self.enabled:
+            return
+        self._stop_event.set()
+        if self._sampler:
+            self._sampler.join()
+            self._sampler = None
+        self._sample_rss()
+        self._end_time = time.perf_counter()
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self._stages = {}
+            self._counters = {}
+            self._rss_samples = []
+
+    def _sample_rss(self):
+        rss_bytes = get_rss_bytes()
+        if rss_bytes is not None:
+            with self._lock:
+                self._rss_samples.append(
+                    (time.perf_counter() - self._start_time, rss_bytes))
+
+    def _run_sampler(self):
+        while not self._stop_event.wait(self._sample_interval):
+            self._sample_rss()
+
+    def add_time(self, stage, seconds):
+        with self._lock:
+            stage_times = self._stages.setdefault(stage, [0.0, 0])
+            stage_times[0] += seconds
+            stage_times[1] += 1
+
+    @contextmanager
+    def timer(self, stage):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start)
+
+    def timed_iter(self, stage, iterable):
+        '''
+        yields the items of iterable, timing how long each one takes to arrive
+        (e.g. the pages of a paged api, or the chunks of a csv file)
+        '''
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                this_item = next(iterator)
+            except StopIteration:
+                return
+            if self.enabled:
+                self.add_time(stage, time.perf_counter() - start)
+            yield this_item
+
+    def count(self, name, value=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def count_file_bytes(self, name, file_path):
+        if self.enabled and file_path and os.path.isfile(file_path):
+            self.count(name, os.path.getsize(file_path))
+
+    def get_report(self):
+        end_time = self._end_time if self._end_time is not None else time.perf_counter()
+        with self._lock:
+            counters = dict(self._counters)
+            stages = {stage: {"seconds": seconds, "calls": calls}
+                      for stage, (seconds, calls) in self._stages.items()}
+            rss_samples = list(self._rss_samples)
+
+        cache_hit_rates = {}
+        for name, hits in counters.items():
+            if not name.endswith("_hits"):
+                continue
+            cache_name = name[:-len("_hits")]
+            lookups = hits + counters.get(f'{cache_name}_misses', 0)
+            if lookups:
+                cache_hit_rates[cache_name] = hits / lookups
+
+        return {
+            "script": os.path.splitext(os.path.basename(sys.argv[0]))[0],
+            "elapsed_seconds": end_time - self._start_time if self._start_time is not None else 0.0,
+            "stages": stages,
+            "counters": counters,
+            "cache_hit_rates": cache_hit_rates,
+            "peak_rss_bytes": max([rss_bytes for _, rss_bytes in rss_samples] +
+                                  [_get_max_rss_bytes() or 0]) or None,
+            "peak_children_rss_bytes": _get_max_rss_bytes("RUSAGE_CHILDREN"),
+            "rss_samples": rss_samples
+        }
+
+    def format_prometheus(self, report):
+        labels = f'script="{report["script"]}"'
+        lines = [f'# TYPE {METRICS_PREFIX}_elapsed_seconds gauge',
+                 f'{METRICS_PREFIX}_elapsed_seconds{{{labels}}} {report["elapsed_seconds"]}',
+                 f'# TYPE {METRICS_PREFIX}_stage_seconds_total counter']
+        for stage, stage_times in report["stages"].items():
+            lines.append(
+                f'{METRICS_PREFIX}_stage_seconds_total{{{labels},stage="{stage}"}} {stage_times["seconds"]}')
+        lines.append(f'# TYPE {METRICS_PREFIX}_stage_calls_total counter')
+        for stage, stage_times in report["stages"].items():
+            lines.append(
+                f'{METRICS_PREFIX}_stage_calls_total{{{labels},stage="{stage}"}} {stage_times["calls"]}')
+        for name, value in report["counters"].items():
+            lines.append(f'# TYPE {METRICS_PREFIX}_{name}_total counter')
+            lines.append(
+                f'{METRICS_PREFIX}_{name}_total{{{labels}}} {value}')
+        if report["cache_hit_rates"]:
+            lines.append(f'# TYPE {METRICS_PREFIX}_cache_hit_ratio gauge')
+        for cache_name, hit_rate in report["cache_hit_rates"].items():
+            lines.append(
+                f'{METRICS_PREFIX}_cache_hit_ratio{{{labels},cache="{cache_name}"}} {hit_rate}')
+        for name in ("peak_rss_bytes", "peak_children_rss_bytes"):
+            if report[name] is not None:
+                lines.append(f'# TYPE {METRICS_PREFIX}_{name} gauge')
+                lines.append(
+                    f'{METRICS_PREFIX}_{name}{{{labels}}} {report[name]}')
+        return "\n".join(lines) + "\n"
+
+    def write_report(self, output_path, output_format="json"):
+        report = self.get_report()
+        with open(output_path, 'w') as output_file:
+            if output_format == "prometheus":
+                output_file.write(self.format_prometheus(report))
+            else:
+                json.dump(report, output_file, indent=2)
+
+    def print_report(self):
+        report = self.get_report()
+        elapsed = report["elapsed_seconds"]
+        print('---- profile ----')
+        print(f'elapsed: {elapsed:.3f}s')
+        for stage, stage_times in sorted(report["stages"].items(),
+                                         key=lambda item: item[1]["seconds"], reverse=True):
+            share = stage_times["seconds"] / elapsed * 100 if elapsed else 0
+            print(
+                f'{stage}: {stage_times["seconds"]:.3f}s ({share:.1f}%) in {stage_times["calls"]} calls')
+        for name, value in report["counters"].items():
+            print(f'{name}: {value}')
+        for cache_name, hit_rate in report["cache_hit_rates"].items():
+            print(f'{cache_name} hit rate: {hit_rate:.1%}')
+        if report["peak_rss_bytes"]:
+            print(f'peak rss: {report["peak_rss_bytes"] / (1024 * 1024):.1f} MB')
+
+
+_metrics = Metrics()
+
+
+def get_metrics():
+    return _metrics
+
+
+def add_metrics_arguments(parser):
+    parser.add_argument("--profile", action="store_true",
+                        help="print the time spent in each stage, counters and peak memory at the end")
+    parser.add_argument("--metrics-out", help="write the profile to this file")
+    parser.add_argument("--metrics-format", choices=METRICS_FORMATS, default="json",
+                        help="format of the --metrics-out file")
+
+
+def start_metrics(args):
+    if args.profile or args.metrics_out:
+        get_metrics().enable()
+
+
+def finish_metrics(args):
+    metrics = get_metrics()
+    if not metrics.enabled:
+        return
+    metrics.disable()
+    if args.profile:
+        metrics.print_report()
+    if args.metrics_out:
+        metrics.write_report(args.metrics_out, args.metrics_format)
@@ -1,17 +1,83 @@
 import html
+import json
+import os
 import re
 import string
 import sys
 import unicodedata
+from functools import lru_cache
 from itertools import islice, tee, groupby
 from nltk.tokenize import WordPunctTokenizer
 
 regex_clean_newlines = re.compile(r"[\r|\n|\r\n]")
 regex_strip_urls = re.compile(r"\[http[s]?://.*?\s(.*?)\]")
 regex_strip_punct = re.compile(r'[%s]' % re.escape(string.punctuation))
+regex_list_separators = re.compile(r'[\.;\:]')
+regex_hashtags = re.compile(r'#(\w+)')
+regex_urls = re.compile(
+    r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\(\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+')
 
-punct_unicode_tbl = dict.fromkeys(i for i in range(sys.maxunicode)
-                                  if unicodedata.category(chr(i)).startswith('P'))
+# the characters regex_clean_newlines replaces
+newline_tbl = str.maketrans("\r|\n", "   ")
+
+# directory the punctuation table is cached in, nothing is written unless it is set
+PUNCT_CACHE_DIR = os.environ.get("TRUST_DEFENDER_CACHE_DIR")
+
+
+def _get_punct_cache_path():
+    return os.path.join(PUNCT_CACHE_DIR, f'punct_unicode_{unicodedata.unidata_version}.json')
+
+
+@lru_cache(maxsize=None)
+def get_punct_unicode_tbl():
+    '''
+    translation table deleting every unicode punctuation (P*) character
+
+    built on first use rather than at import, since it means checking the category
+    of every code point. When TRUST_DEFENDER_CACHE_DIR is set, the code point list is
+    cached there (per unicode database version) so later processes can skip the
+    scan; if the directory can't be written the table is just built in memory
+    '''
+    cache_path = _get_punct_cache_path() if PUNCT_CACHE_DIR else None
+    if cache_path:
+        try:
+            with open(cache_path) as cache_file:
+                return dict.fromkeys(json.load(cache_file))
+        except (OSError, ValueError):
+            pass
+
+    code_points = [i for i in range(sys.maxunicode)
+                   if unicodedata.category(chr(i)).startswith('P')]
+    if cache_path:
+        try:
+            os.makedirs(PUNCT_CACHE_DIR, exist_ok=True)
+            # written to a temporary file first, so other processes never read half of it
+            temp_path = f'{cache_path}.{os.getpid()}.tmp'
+            with open(temp_path, 'w') as cache_file:
+                json.dump(code_points, cache_file)
+            os.replace(temp_path, cache_path)
+        except OSError:
+            pass
+    return dict.fromkeys(code_points)
+
+
+@lru_cache(maxsize=None)
+def get_clean_text_tbl():
+    '''
+    translation table doing clean_text's newline, punctuation and "=" passes in one go:
+    newlines and ascii punctuation become spaces, other unicode punctuation is removed
+    '''
+    clean_tbl = dict(get_punct_unicode_tbl())
+    clean_tbl.update(dict.fromkeys(map(ord, string.punctuation), " "))
+    clean_tbl.update(newline_tbl)
+    return clean_tbl
+
+
+def __getattr__(name):
+    # punct_unicode_tbl used to be built at import time, keep it available lazily
+    if name == "punct_unicode_tbl":
+        return get_punct_unicode_tbl()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
 
 def get_ngrams(str_, n_grams=2):
@@ -56,7 +122,7 @@ def count_repeating_ngrams(str_, ngrams=(2, 4), n_repeats_min=2):
 
 def remove_punctuation(input_string):
     working = regex_strip_punct.sub(" ", input_string)
-    return working.translate(punct_unicode_tbl)
+    return working.translate(get_punct_unicode_tbl())
 
 
 def clean_newlines(input_text):
@@ -67,33 +133,34 @@ def clean_text(str_, remove_urls=False):
     if not str_:
         return ""
 
-    cleaned = clean_newlines(str(str_))
-    cleaned = html.unescape(cleaned)
-    if remove_urls:
-        cleaned = regex_strip_urls.sub(" ", cleaned)
-    cleaned = remove_punctuation(cleaned)
-    cleaned = re.sub(r"=", " ", cleaned)
-    cleaned = re.sub(r"\s\s+", " ", cleaned)
+    cleaned = str(str_)
+    # newlines only need replacing up front when unescaping or url stripping could
+    # be affected by them, otherwise the single translate below handles them
+    if remove_urls or "&" in cleaned:
+        cleaned = cleaned.translate(newline_tbl)
+        cleaned = html.unescape(cleaned)
+        if remove_urls:
+            cleaned = regex_strip_urls.sub(" ", cleaned)
+    cleaned = cleaned.translate(get_clean_text_tbl())
 
-    return cleaned.strip().lower()
+    return " ".join(cleaned.split()).lower()
 
 
-def tokenize(str_):
-    return WordPunctTokenizer().tokenize(str_)
+# stateless (a compiled regex), so one is shared by every call
+_word_punct_tokenizer = WordPunctTokenizer()
 
 
-def get_list_item_count(raw_text):
-    splitted = re.split(r'[\.;\:]', raw_text)
-    return len(splitted)
+def tokenize(str_):
+    return _word_punct_tokenizer.tokenize(str_)
 
 
 def get_list_item_count(raw_text):
-    splitted = re.split(r'[\.;\:]', raw_text)
+    splitted = regex_list_separators.split(raw_text)
     return len(splitted)
 
 
 def get_hashtags(input_text):
-    return re.findall(r'#(\w+)', input_text)
+    return regex_hashtags.findall(input_text)
 
 
 def get_hashtag_count(tokens):
@@ -110,7 +177,7 @@ def get_hashtag_count(tokens):
 
 
 def get_urls(raw_text):
-    return re.findall(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\(\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+', raw_text)
+    return regex_urls.findall(raw_text)
 
 
 def get_url_count(raw_text):